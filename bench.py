@@ -0,0 +1,312 @@
+import os
+import sys
+import json
+import time
+import hmac
+import random
+import asyncio
+import hashlib
+import secrets
+import argparse
+import platform
+import sqlite3
+import tempfile
+from datetime import date, timedelta
+from urllib.parse import urlencode
+
+# Benchmark: sintetik data.db yaratadi va db.py funksiyalari hamda Mini App
+# API marshrutlarining kechikish persentillari/throughput'ini JSON qilib chiqaradi.
+#
+#   python bench.py --shops 200 --periods 24 --ops 2000 --out bench.json
+#
+# Natijalarni o'zgarishlardan oldin/keyin solishtirish uchun saqlab qo'ying.
+
+
+def sign_init_data(bot_token: str, user_id: int, auth_date: int = None) -> str:
+    # Telegram WebApp initData ni lokal token bilan imzolaydi
+    data = {
+        "auth_date": str(auth_date or int(time.time())),
+        "query_id": "bench",
+        "user": json.dumps({"id": user_id, "first_name": "Bench"}, separators=(",", ":")),
+    }
+    check = "\n".join(f"{k}={v}" for k, v in sorted(data.items()))
+    secret = hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+    data["hash"] = hmac.new(secret, check.encode(), hashlib.sha256).hexdigest()
+    return urlencode(data)
+
+
+def summarize(latencies: list, wall: float) -> dict:
+    ordered = sorted(latencies)
+    n = len(ordered)
+
+    def pct(p: float) -> float:
+        return round(ordered[min(n - 1, int(p * n))] * 1000, 4)
+
+    return {
+        "n": n,
+        "mean_ms": round(sum(ordered) / n * 1000, 4),
+        "p50_ms": pct(0.50),
+        "p90_ms": pct(0.90),
+        "p99_ms": pct(0.99),
+        "max_ms": round(ordered[-1] * 1000, 4),
+        "ops_per_s": round(n / wall, 1) if wall else None,
+    }
+
+
+async def measure(fn, n: int, concurrency: int = 1) -> dict:
+    latencies = []
+    counter = iter(range(n))
+
+    async def worker():
+        for i in counter:
+            t = time.perf_counter()
+            await fn(i)
+            latencies.append(time.perf_counter() - t)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def seed(path: str, shops: int, periods: int, days: int, seed_value: int = 1) -> dict:
+    # sxema db_init orqali yaratilgan bo'lishi kerak; bu yerda faqat ma'lumot
+    rnd = random.Random(seed_value)
+    conn = sqlite3.connect(path)
+    start0 = date(2020, 1, 1)
+    sales = purchases = expenses = 0
+    with conn:
+        for uid in range(1, shops + 1):
+            conn.execute("INSERT OR IGNORE INTO users(telegram_id) VALUES(?)", (uid,))
+            conn.execute("INSERT OR IGNORE INTO reminders(telegram_id) VALUES(?)", (uid,))
+            stock = rnd.randint(1, 50) * 1_000_000
+            for k in range(periods):
+                start = start0 + timedelta(days=15 * k)
+                end = start + timedelta(days=14)
+                last = k == periods - 1
+                closing = None if last else rnd.randint(1, 50) * 1_000_000
+                cur = conn.execute("""
+                    INSERT INTO periods(telegram_id, start_date, end_date, opening_stock_cost, closing_stock_cost, is_closed)
+                    VALUES(?,?,?,?,?,?)
+                """, (uid, start.isoformat(), end.isoformat(), stock, closing, 0 if last else 1))
+                pid = cur.lastrowid
+                stock = closing or stock
+                day_rows = [
+                    (uid, pid, (start + timedelta(days=d)).isoformat(),
+                     rnd.randint(0, 5_000_000), rnd.randint(0, 5_000_000))
+                    for d in range(min(days, 15))
+                ]
+                conn.executemany("""
+                    INSERT INTO daily_sales(telegram_id, period_id, date, cash_amount, card_amount) VALUES(?,?,?,?,?)
+                """, day_rows)
+                conn.executemany("""
+                    INSERT INTO purchases(telegram_id, period_id, date, total_cost, note) VALUES(?,?,?,?,?)
+                """, [(uid, pid, r[2], rnd.randint(0, 9_000_000), "bench") for r in day_rows[::3]])
+                conn.executemany("""
+                    INSERT INTO expenses(telegram_id, period_id, date, amount, note) VALUES(?,?,?,?,?)
+                """, [(uid, pid, r[2], rnd.randint(0, 500_000), "bench") for r in day_rows[::2]])
+                sales += len(day_rows)
+                purchases += len(day_rows[::3])
+                expenses += len(day_rows[::2])
+    conn.close()
+    return {"shops": shops, "periods": shops * periods, "daily_sales": sales, "purchases": purchases, "expenses": expenses}
+
+
+async def bench_db(db_api, shops: int, ops: int, concurrency: int) -> dict:
+    rnd = random.Random(2)
+    uids = [rnd.randint(1, shops) for _ in range(ops)]
+    open_ids = await db_api.open_periods_for(list(range(1, shops + 1)))
+    today = date.today().isoformat()
+    results = {}
+
+    async def add_sale(i):
+        uid = uids[i]
+        await db_api.add_sale(uid, open_ids[uid]["id"], today, 1000 + i, 2000 + i)
+
+    async def totals(i):
+        uid = uids[i]
+        await db_api.period_totals(uid, open_ids[uid]["id"])
+
+    async def open_period_cold(i):
+        db_api._period_cache.clear()
+        await db_api.get_open_period(uids[i])
+
+    async def open_period(i):
+        await db_api.get_open_period(uids[i])
+
+    results["add_sale"] = await measure(add_sale, ops, concurrency)
+    results["period_totals"] = await measure(totals, ops, concurrency)
+    results["get_open_period_uncached"] = await measure(open_period_cold, ops, concurrency)
+    db_api._period_cache.clear()
+    results["get_open_period"] = await measure(open_period, ops, concurrency)
+    return results
+
+
+async def bench_http(webapp_server, bot_token: str, shops: int, ops: int, concurrency: int) -> dict:
+    from aiohttp.test_utils import TestClient, TestServer
+
+    rnd = random.Random(3)
+    uids = [rnd.randint(1, shops) for _ in range(ops)]
+    auth = {uid: sign_init_data(bot_token, uid) for uid in set(uids)}
+    results = {}
+
+    app = await webapp_server.create_app()
+    async with TestClient(TestServer(app)) as client:
+        async def post(path, i, payload):
+            r = await client.post(path, json={"_auth": auth[uids[i]], **payload})
+            body = await r.json()
+            if r.status != 200 or not body.get("ok"):
+                raise RuntimeError(f"{path}: {r.status} {body}")
+
+        async def sale(i):
+            await post("/api/sale", i, {"cash": 1000 + i, "card": 500})
+
+        async def report(i):
+            await post("/api/report", i, {})
+
+        results["POST /api/sale"] = await measure(sale, ops, concurrency)
+        results["POST /api/report"] = await measure(report, ops, concurrency)
+    return results
+
+
+def _baseline_batch_item(raw, today: str) -> dict:
+    # schemas.py dan oldingi webapp_server.parse_batch_item (solishtirish uchun)
+    key = str(raw.get("key") or "").strip()
+    op = raw.get("op")
+    d = str(raw.get("date") or today)
+    if date.fromisoformat(d) > date.fromisoformat(today):
+        raise ValueError("sana kelajakda")
+    item = {"key": key, "op": op, "date": d}
+    if op == "sale":
+        item.update(cash=int(raw.get("cash", 0)), card=int(raw.get("card", 0)),
+                    accumulate=bool(raw.get("accumulate", False)))
+    else:
+        item.update(amount=int(raw.get("amount", 0)), note=str(raw.get("note") or "-"))
+    return item
+
+
+def bench_codec(n: int) -> dict:
+    # bitta so'rov uchun decode + validate + encode narxi (mikrosekund):
+    # "baseline" = stdlib json + qo'lda int(...), "schemas" = schemas.py + tanlangan codec
+    import schemas
+
+    today = date.today().isoformat()
+    auth = "query_id=bench&user=%7B%22id%22%3A1%7D&auth_date=1700000000&hash=" + "0" * 64
+    sale = json.dumps({"_auth": auth, "cash": 1250000, "card": 830000}).encode()
+    batch = json.dumps({"_auth": auth, "items": [
+        {"key": f"k{i}", "op": ("sale", "expense", "purchase")[i % 3], "date": today,
+         "cash": 1000 + i, "card": 500, "amount": 700 + i, "note": "bench"}
+        for i in range(50)
+    ]}).encode()
+    report = {"ok": True, "periods": [
+        {"id": i, "start_date": today, "end_date": today, "opening_stock_cost": 5_000_000,
+         "totals": {"cash": 9_000_000, "card": 4_000_000, "purchases": 7_000_000, "expenses": 300_000}}
+        for i in range(24)
+    ]}
+
+    def baseline_sale():
+        body = json.loads(sale)
+        body["_auth"]
+        int(body.get("cash", 0)), int(body.get("card", 0)), bool(body.get("accumulate", False))
+        return json.dumps({"ok": True})
+
+    def schemas_sale():
+        schemas.decode(sale, schemas.SaleRequest)
+        return schemas.codec.dumps({"ok": True})
+
+    def baseline_batch():
+        body = json.loads(batch)
+        items = [_baseline_batch_item(raw, today) for raw in body["items"]]
+        return json.dumps({"ok": True, "items": [{"key": i["key"], "status": "ok"} for i in items]})
+
+    def schemas_batch():
+        req = schemas.decode(batch, schemas.BatchRequest)
+        items = [schemas.parse_batch_item(raw, today) for raw in req.items]
+        return schemas.codec.dumps({"ok": True, "items": [{"key": i["key"], "status": "ok"} for i in items]})
+
+    def timed(fn) -> float:
+        fn()
+        started = time.perf_counter()
+        for _ in range(n):
+            fn()
+        return round((time.perf_counter() - started) / n * 1e6, 2)
+
+    return {
+        "codec": schemas.codec.name,
+        "n": n,
+        "sale_us": {"baseline": timed(baseline_sale), "schemas": timed(schemas_sale)},
+        "batch50_us": {"baseline": timed(baseline_batch), "schemas": timed(schemas_batch)},
+        "encode_history24_us": {
+            "baseline": timed(lambda: json.dumps(report)),
+            "schemas": timed(lambda: schemas.codec.dumps(report)),
+        },
+    }
+
+
+async def run(args) -> dict:
+    path = args.db
+    if not path:
+        path = os.path.join(tempfile.mkdtemp(prefix="autohisob-bench-"), "data.db")
+    elif os.path.exists(path):
+        raise SystemExit(f"{path} allaqachon bor: benchmark faqat yangi faylga yozadi")
+
+    bot_token = f"{random.randint(10**8, 10**9)}:{secrets.token_urlsafe(24)}"
+    os.environ["BOT_TOKEN"] = bot_token
+    os.environ["DB_PATH"] = path
+    os.environ["BOT_MODE"] = "polling"  # .env dagi webhook sozlamasi Telegramga murojaat qilmasin
+
+    import db as db_api
+    import webapp_server
+
+    db_api.DB = path
+    await db_api.db_init()
+    await db_api.db_close()
+
+    started = time.perf_counter()
+    dataset = seed(path, args.shops, args.periods, args.days)
+    dataset["seed_seconds"] = round(time.perf_counter() - started, 3)
+
+    await db_api.db_init()
+    try:
+        results = await bench_db(db_api, args.shops, args.ops, args.concurrency)
+    finally:
+        await db_api.db_close()
+    results.update(await bench_http(webapp_server, bot_token, args.shops, args.ops, args.concurrency))
+    results["codec"] = bench_codec(args.ops)
+
+    return {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "params": {"ops": args.ops, "concurrency": args.concurrency},
+        "dataset": dataset,
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AutoHisob db.py va Mini App API benchmarki")
+    parser.add_argument("--shops", type=int, default=100)
+    parser.add_argument("--periods", type=int, default=24, help="har bir do'kon uchun 15 kunlik davrlar")
+    parser.add_argument("--days", type=int, default=15, help="har bir davrdagi savdo kunlari")
+    parser.add_argument("--ops", type=int, default=1000, help="har bir o'lchov uchun so'rovlar soni")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--db", default="", help="yangi baza fayli (default: vaqtinchalik papka)")
+    parser.add_argument("--out", default="", help="JSON natija fayli (default: stdout)")
+    parser.add_argument("--codec-only", action="store_true", help="faqat JSON/validatsiya mikro-benchmarki")
+    args = parser.parse_args()
+
+    if args.codec_only:
+        report = {"python": sys.version.split()[0], "results": {"codec": bench_codec(max(args.ops, 10000))}}
+    else:
+        report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
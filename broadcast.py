@@ -0,0 +1,134 @@
+import os
+import time
+import asyncio
+import logging
+
+from aiogram.exceptions import (
+    TelegramRetryAfter,
+    TelegramForbiddenError,
+    TelegramBadRequest,
+    TelegramNetworkError,
+    TelegramServerError,
+)
+
+log = logging.getLogger(__name__)
+
+# Telegram: umumiy ~30 xabar/soniya, bitta chatga ~1 xabar/soniya
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "20"))
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+BROADCAST_CHAT_INTERVAL = float(os.getenv("BROADCAST_CHAT_INTERVAL", "1.0"))
+BROADCAST_MAX_RETRIES = int(os.getenv("BROADCAST_MAX_RETRIES", "3"))
+
+
+class RateLimiter:
+    # token bucket: o'rtacha `rate` ta/soniya, `burst` tagacha birdaniga
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        # RetryAfter kelganda hamma yuboruvchilar to'xtaydi
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class Broadcaster:
+    # Cheklangan parallellik bilan xabar yuborish: umumiy va chat bo'yicha
+    # limitlar, RetryAfter va tarmoq xatolarida qayta urinish.
+    def __init__(
+        self,
+        bot,
+        concurrency: int = BROADCAST_CONCURRENCY,
+        rate: float = BROADCAST_RATE,
+        chat_interval: float = BROADCAST_CHAT_INTERVAL,
+        max_retries: int = BROADCAST_MAX_RETRIES,
+    ):
+        self.bot = bot
+        self.concurrency = max(1, concurrency)
+        self.limiter = RateLimiter(rate)
+        self.chat_interval = chat_interval
+        self.max_retries = max_retries
+        self._last_sent = {}
+
+    async def run(self, messages) -> dict:
+        # messages: (chat_id, text, kwargs) lar ketma-ketligi
+        stats = {"delivered": 0, "failed": 0, "throttled": 0, "retried": 0}
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        started = time.monotonic()
+
+        async def worker():
+            while True:
+                item = await queue.get()
+                try:
+                    if item is None:
+                        return
+                    await self._deliver(*item, stats)
+                except Exception:
+                    # kutilmagan xato bitta xabarni yo'qotadi, workerni emas:
+                    # aks holda navbat bo'shatilmaydi va queue.put abadiy kutadi
+                    stats["failed"] += 1
+                    log.exception("xabar yuborishda kutilmagan xato %s", item[0])
+                finally:
+                    queue.task_done()
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        try:
+            for message in messages:
+                await queue.put(message)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for w in workers:
+                w.cancel()
+            self._last_sent.clear()
+
+        stats["seconds"] = round(time.monotonic() - started, 3)
+        return stats
+
+    async def _wait_chat(self, chat_id: int):
+        last = self._last_sent.get(chat_id)
+        if last is not None:
+            delay = last + self.chat_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        self._last_sent[chat_id] = time.monotonic()
+
+    async def _deliver(self, chat_id: int, text: str, kwargs: dict, stats: dict):
+        for attempt in range(self.max_retries + 1):
+            await self._wait_chat(chat_id)
+            await self.limiter.acquire()
+            try:
+                await self.bot.send_message(chat_id, text, **kwargs)
+                stats["delivered"] += 1
+                return
+            except TelegramRetryAfter as e:
+                stats["throttled"] += 1
+                self.limiter.pause(e.retry_after)
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                # bot bloklangan / chat yo'q: qayta urinishdan foyda yo'q
+                log.info("xabar yuborilmadi %s: %s", chat_id, e)
+                break
+            except (TelegramNetworkError, TelegramServerError) as e:
+                log.warning("tarmoq xatosi %s: %s", chat_id, e)
+                await asyncio.sleep(min(30, 2 ** attempt))
+            if attempt < self.max_retries:
+                stats["retried"] += 1
+        stats["failed"] += 1
@@ -1,9 +1,510 @@
+import os
+import time
+import asyncio
+import bisect
+import inspect
+import logging
+from collections import OrderedDict
+from datetime import date, timedelta
+from contextlib import asynccontextmanager
+
 import aiosqlite
 
-DB = "data.db"
+from metrics import db_timed, cache_collector
+
+DB = os.getenv("DB_PATH", "data.db")
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+
+# Saqlash profili: har bir yangi ulanishda qo'llanadigan PRAGMA'lar.
+# WAL rejimida o'quvchilar (period_totals, hisobotlar) yozuvchilarni to'smaydi,
+# bot va web app bitta data.db ga bir vaqtda yoza oladi.
+STORAGE_PROFILE = {
+    "journal_mode": os.getenv("DB_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("DB_SYNCHRONOUS", "NORMAL"),
+    "cache_size": int(os.getenv("DB_CACHE_SIZE", "-16000")),  # manfiy qiymat = KiB
+    "mmap_size": int(os.getenv("DB_MMAP_SIZE", str(64 * 1024 * 1024))),
+    "busy_timeout": int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000")),
+    "wal_autocheckpoint": int(os.getenv("DB_WAL_AUTOCHECKPOINT", "1000")),  # sahifalar
+    "temp_store": os.getenv("DB_TEMP_STORE", "MEMORY"),
+}
+
+# Ochiq davr keshi (telegram_id -> davr). Bot va web app alohida jarayon bo'lsa
+# OPEN_PERIOD_CACHE_STAMP=1 har hit'da period_stamps versiyasini tekshiradi.
+OPEN_PERIOD_CACHE_SIZE = int(os.getenv("OPEN_PERIOD_CACHE_SIZE", "10000"))
+OPEN_PERIOD_CACHE_TTL = float(os.getenv("OPEN_PERIOD_CACHE_TTL", "30"))
+OPEN_PERIOD_CACHE_STAMP = os.getenv("OPEN_PERIOD_CACHE_STAMP", "1").strip() == "1"
+
+# Fon checkpoint oralig'i (soniya). 0 bo'lsa faqat wal_autocheckpoint ishlaydi.
+CHECKPOINT_INTERVAL = int(os.getenv("DB_CHECKPOINT_INTERVAL", "300"))
+CHECKPOINT_MODE = os.getenv("DB_CHECKPOINT_MODE", "PASSIVE")
+
+log = logging.getLogger(__name__)
+
+
+class Pool:
+    # doimiy ulanishlar to'plami: har chaqiruvda yangi thread va fayl ochilmaydi.
+    # Ulanishlar kerak bo'lganda ochiladi, lekin soni `size` dan oshmaydi.
+    def __init__(self, path: str, size: int = POOL_SIZE):
+        self.path = path
+        self.size = max(1, size)
+        self.closed = False
+        self._conns = []
+        self._idle = asyncio.Queue()
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        conn = aiosqlite.connect(self.path, timeout=STORAGE_PROFILE["busy_timeout"] / 1000)
+        # db_close chaqirilmay qolsa ham jarayon ulanish thread'larini kutib osilib qolmasin
+        conn.daemon = True
+        await conn
+        await apply_storage_profile(conn)
+        return conn
+
+    @asynccontextmanager
+    async def acquire(self):
+        if self.closed:
+            raise RuntimeError("DB pool yopilgan")
+
+        conn = None
+        if self._idle.empty() and len(self._conns) < self.size:
+            async with self._lock:
+                if len(self._conns) < self.size:
+                    conn = await self._connect()
+                    self._conns.append(conn)
+        if conn is None:
+            conn = await self._idle.get()
+
+        try:
+            yield conn
+        finally:
+            # commit qilinmagan tranzaksiya keyingi chaqiruvchiga o'tib ketmasin
+            try:
+                if conn.in_transaction:
+                    await conn.rollback()
+            except Exception:
+                log.exception("DB ulanishi buzildi, to'plamdan chiqarildi")
+                conn = await self._replace(conn)
+            if conn is not None:
+                if self.closed:
+                    await conn.close()
+                else:
+                    self._idle.put_nowait(conn)
+
+    async def _replace(self, broken):
+        # buzilgan ulanish yopiladi va _conns dan chiqariladi; _idle.get() da
+        # kutayotganlar osilib qolmasligi uchun o'rniga yangisi ochiladi
+        self._conns.remove(broken)
+        try:
+            await broken.close()
+        except Exception:
+            pass
+        if self.closed:
+            return None
+        async with self._lock:
+            if len(self._conns) >= self.size:
+                return None
+            try:
+                conn = await self._connect()
+            except Exception:
+                log.exception("yangi DB ulanishini ochib bo'lmadi")
+                return None
+            self._conns.append(conn)
+        return conn
+
+    async def close(self):
+        self.closed = True
+        while not self._idle.empty():
+            conn = self._idle.get_nowait()
+            await conn.close()
+        self._conns.clear()
+
+
+class OpenPeriodCache:
+    # TTL + LRU kesh. Qiymat sifatida "ochiq davr yo'q" (None) ham saqlanadi.
+    def __init__(self, size: int = OPEN_PERIOD_CACHE_SIZE, ttl: float = OPEN_PERIOD_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self._items = OrderedDict()  # telegram_id -> (expires_at, version, period)
+        self._by_period = {}  # period_id -> telegram_id
+
+    def get(self, telegram_id: int):
+        item = self._items.get(telegram_id)
+        if item is None:
+            return None
+        if item[0] < time.monotonic():
+            self._drop(telegram_id)
+            return None
+        self._items.move_to_end(telegram_id)
+        return item
+
+    def put(self, telegram_id: int, version: int, period):
+        if self.size <= 0 or self.ttl <= 0:
+            return
+        self._drop(telegram_id)
+        self._items[telegram_id] = (time.monotonic() + self.ttl, version, period)
+        if period is not None:
+            self._by_period[period["id"]] = telegram_id
+        while len(self._items) > self.size:
+            self._drop(next(iter(self._items)))
+
+    def invalidate(self, telegram_id: int):
+        self._drop(telegram_id)
+
+    def invalidate_period(self, period_id: int):
+        telegram_id = self._by_period.get(period_id)
+        if telegram_id is not None:
+            self._drop(telegram_id)
+
+    def clear(self):
+        self._items.clear()
+        self._by_period.clear()
+
+    def _drop(self, telegram_id: int):
+        item = self._items.pop(telegram_id, None)
+        if item is not None and item[2] is not None:
+            self._by_period.pop(item[2]["id"], None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+_period_cache = OpenPeriodCache()
+
+def cache_stats() -> dict:
+    return {"open_period": _period_cache.stats()}
+
+cache_collector(cache_stats)
+
+_pool = None
+
+def get_pool() -> Pool:
+    global _pool
+    if _pool is None or _pool.closed:
+        _pool = Pool(DB)
+    return _pool
+
+def _conn():
+    return get_pool().acquire()
+
+@asynccontextmanager
+async def _tx():
+    # BEGIN IMMEDIATE: yozish qulfi boshidanoq olinadi, shuning uchun
+    # o'qib-keyin-yozadigan tranzaksiyalar "database is locked" bilan yiqilmaydi,
+    # balki busy_timeout davomida navbat kutadi
+    async with _conn() as db:
+        await db.execute("BEGIN IMMEDIATE")
+        yield db
+        await db.commit()
+
+async def apply_storage_profile(conn):
+    for name, value in STORAGE_PROFILE.items():
+        await conn.execute(f"PRAGMA {name}={value}")
+
+@db_timed
+async def wal_checkpoint(mode: str = CHECKPOINT_MODE):
+    # WAL faylni asosiy bazaga ko'chiradi. PASSIVE hech kimni kutmaydi;
+    # TRUNCATE esa WAL faylni ham qisqartiradi (tungi vaqt uchun).
+    # main.py buni har CHECKPOINT_INTERVAL soniyada scheduler orqali chaqiradi.
+    async with _conn() as db:
+        cur = await db.execute(f"PRAGMA wal_checkpoint({mode})")
+        busy, log_pages, done_pages = await cur.fetchone()
+        return {"busy": busy, "log": log_pages, "checkpointed": done_pages}
 
+@db_timed
+async def db_close():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+# Davr yig'indilari: period_summary jadvali har bir savdo/kirim/chiqim
+# yozuvi bilan birga (o'sha tranzaksiyada, triggerlar orqali) yangilanadi,
+# shuning uchun hisobot bitta PRIMARY KEY qidiruvi bo'ladi.
+_SUMMARY_COLUMNS = {
+    "daily_sales": {"cash": "cash_amount", "card": "card_amount"},
+    "purchases": {"purchases": "total_cost"},
+    "expenses": {"expenses": "amount"},
+}
+
+_SUMMARY_FROM_RAW = """
+    SELECT telegram_id, period_id, SUM(cash), SUM(card), SUM(purchases), SUM(expenses)
+    FROM (
+        SELECT telegram_id, period_id, COALESCE(cash_amount,0) AS cash, COALESCE(card_amount,0) AS card,
+               0 AS purchases, 0 AS expenses
+        FROM daily_sales
+        UNION ALL
+        SELECT telegram_id, period_id, 0, 0, COALESCE(total_cost,0), 0 FROM purchases
+        UNION ALL
+        SELECT telegram_id, period_id, 0, 0, 0, COALESCE(amount,0) FROM expenses
+    )
+    GROUP BY telegram_id, period_id
+"""
+
+def _summary_triggers(table: str) -> list:
+    columns = _SUMMARY_COLUMNS[table]
+
+    def bump(row: str, sign: str) -> str:
+        sets = ", ".join(f"{dst}={dst}{sign}COALESCE({row}.{src},0)" for dst, src in columns.items())
+        return (
+            # INSERT OR IGNORE emas: trigger ichida tashqi upsert'ning conflict siyosati ustun keladi
+            f"INSERT INTO period_summary(telegram_id, period_id) "
+            f"SELECT {row}.telegram_id, {row}.period_id WHERE NOT EXISTS ("
+            f"SELECT 1 FROM period_summary WHERE telegram_id={row}.telegram_id AND period_id={row}.period_id); "
+            f"UPDATE period_summary SET {sets} "
+            f"WHERE telegram_id={row}.telegram_id AND period_id={row}.period_id;"
+        )
+
+    watched = ", ".join(["telegram_id", "period_id", *columns.values()])
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS trg_{table}_summary_ins AFTER INSERT ON {table} "
+        f"BEGIN {bump('NEW', '+')} END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_{table}_summary_upd AFTER UPDATE OF {watched} ON {table} "
+        f"BEGIN {bump('OLD', '-')} {bump('NEW', '+')} END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_{table}_summary_del AFTER DELETE ON {table} "
+        f"BEGIN {bump('OLD', '-')} END",
+    ]
+
+# O'zgarishlar hisoblagichi: har bir yozuvda foydalanuvchining user_changes.seq
+# qiymati oshadi va yozuv change_seq ustuniga shu qiymat tushadi. Mini App
+# /api/sync da oxirgi ko'rgan seq ni yuborib, faqat yangi o'zgarishlarni oladi.
+_CHANGE_COLUMNS = {
+    "daily_sales": ("period_id", "date", "cash_amount", "card_amount"),
+    "purchases": ("period_id", "date", "total_cost", "note"),
+    "expenses": ("period_id", "date", "amount", "note"),
+}
+
+def _bump_change(row: str) -> str:
+    return (
+        f"INSERT INTO user_changes(telegram_id, seq) SELECT {row}.telegram_id, 0 WHERE NOT EXISTS ("
+        f"SELECT 1 FROM user_changes WHERE telegram_id={row}.telegram_id); "
+        f"UPDATE user_changes SET seq=seq+1 WHERE telegram_id={row}.telegram_id;"
+    )
+
+def _change_triggers(table: str) -> list:
+    # change_seq ning o'zi kuzatilmaydi: trigger o'zini qayta ishga tushirmaydi
+    stamp = (
+        f"UPDATE {table} SET change_seq=(SELECT seq FROM user_changes WHERE telegram_id=NEW.telegram_id) "
+        f"WHERE id=NEW.id;"
+    )
+    watched = ", ".join(_CHANGE_COLUMNS[table])
+    return [
+        f"ALTER TABLE {table} ADD COLUMN change_seq INTEGER NOT NULL DEFAULT 0",
+        f"CREATE INDEX IF NOT EXISTS ix_{table}_change ON {table}(telegram_id, change_seq)",
+        f"CREATE TRIGGER IF NOT EXISTS trg_{table}_change_ins AFTER INSERT ON {table} "
+        f"BEGIN {_bump_change('NEW')} {stamp} END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_{table}_change_upd AFTER UPDATE OF {watched} ON {table} "
+        f"BEGIN {_bump_change('NEW')} {stamp} END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_{table}_change_del AFTER DELETE ON {table} "
+        f"BEGIN {_bump_change('OLD')} END",
+    ]
+
+# Yopilgan davr surati: yig'indilar va foyda yopish paytida bir marta hisoblanib
+# period_snapshots ga yoziladi (reports.period_figures bilan bir xil formula).
+# {where} o'rniga davrlar filtri qo'yiladi.
+_SNAPSHOT_INSERT = """
+    INSERT OR REPLACE INTO period_snapshots(
+        period_id, telegram_id, start_date, end_date, opening, closing,
+        cash, card, purchases, expenses, cogs, gross, net
+    )
+    SELECT id, telegram_id, start_date, end_date, opening, closing,
+           cash, card, purchases, expenses, cogs, cash + card - cogs, cash + card - cogs - expenses
+    FROM (
+        SELECT p.id AS id, p.telegram_id AS telegram_id, p.start_date AS start_date, p.end_date AS end_date,
+               COALESCE(p.opening_stock_cost,0) AS opening, COALESCE(p.closing_stock_cost,0) AS closing,
+               COALESCE(s.cash,0) AS cash, COALESCE(s.card,0) AS card,
+               COALESCE(s.purchases,0) AS purchases, COALESCE(s.expenses,0) AS expenses,
+               COALESCE(p.opening_stock_cost,0) + COALESCE(s.purchases,0) - COALESCE(p.closing_stock_cost,0) AS cogs
+        FROM periods p
+        LEFT JOIN period_summary s ON s.telegram_id=p.telegram_id AND s.period_id=p.id
+        WHERE {where}
+    )
+"""
+
+# Sxema migratsiyalari: N-element bazani N-versiyaga olib chiqadi.
+# Joriy versiya `PRAGMA user_version` da saqlanadi; yangi o'zgarish faqat
+# ro'yxat oxiriga qo'shiladi, eskilari hech qachon tahrirlanmaydi.
+MIGRATIONS = [
+    # 1: indekslar va kunlik savdo uchun unique kalit
+    [
+        # eski bazalarda bir kunga bir nechta yozuv bo'lishi mumkin: eng kichik id li
+        # (birinchi) yozuv qoladi. Eski add_sale mavjud yozuvni ORDER BY siz SELECT bilan
+        # topib yangilardi, ya'ni tuzatilgan oxirgi summalar aynan shu yozuvda;
+        # kattaroq id lar poyga natijasida qo'shilgan eskirgan nusxalar
+        """
+        DELETE FROM daily_sales WHERE id NOT IN (
+            SELECT MIN(id) FROM daily_sales GROUP BY telegram_id, period_id, date
+        )""",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_daily_sales_day ON daily_sales(telegram_id, period_id, date)",
+        "CREATE INDEX IF NOT EXISTS ix_periods_open ON periods(telegram_id, is_closed, id)",
+        "CREATE INDEX IF NOT EXISTS ix_purchases_period ON purchases(telegram_id, period_id)",
+        "CREATE INDEX IF NOT EXISTS ix_expenses_period ON expenses(telegram_id, period_id)",
+    ],
+    # 2: period_summary (davr bo'yicha tayyor yig'indilar)
+    [
+        """
+        CREATE TABLE IF NOT EXISTS period_summary(
+            telegram_id INTEGER NOT NULL,
+            period_id INTEGER NOT NULL,
+            cash INTEGER NOT NULL DEFAULT 0,
+            card INTEGER NOT NULL DEFAULT 0,
+            purchases INTEGER NOT NULL DEFAULT 0,
+            expenses INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY(telegram_id, period_id)
+        ) WITHOUT ROWID""",
+        *_summary_triggers("daily_sales"),
+        *_summary_triggers("purchases"),
+        *_summary_triggers("expenses"),
+        "INSERT INTO period_summary(telegram_id, period_id, cash, card, purchases, expenses) " + _SUMMARY_FROM_RAW,
+    ],
+    # 3: period_stamps (ochiq davr keshini jarayonlararo tekshirish uchun versiya)
+    [
+        """
+        CREATE TABLE IF NOT EXISTS period_stamps(
+            telegram_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )""",
+        *[
+            f"""
+            CREATE TRIGGER IF NOT EXISTS trg_periods_stamp_{event.lower()} AFTER {event} ON periods BEGIN
+                INSERT INTO period_stamps(telegram_id, version) SELECT {row}.telegram_id, 0
+                WHERE NOT EXISTS (SELECT 1 FROM period_stamps WHERE telegram_id={row}.telegram_id);
+                UPDATE period_stamps SET version=version+1 WHERE telegram_id={row}.telegram_id;
+            END"""
+            for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD"))
+        ],
+        "INSERT OR IGNORE INTO period_stamps(telegram_id, version) SELECT DISTINCT telegram_id, 1 FROM periods",
+    ],
+    # 4: /api/batch uchun idempotency kalitlari
+    [
+        """
+        CREATE TABLE IF NOT EXISTS idempotency_keys(
+            telegram_id INTEGER NOT NULL,
+            key TEXT NOT NULL,
+            period_id INTEGER,
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            PRIMARY KEY(telegram_id, key)
+        ) WITHOUT ROWID""",
+    ],
+    # 5: eslatma slotlari bo'yicha qidiruv
+    [
+        "CREATE INDEX IF NOT EXISTS ix_reminders_slot ON reminders(enabled, hour, minute, telegram_id)",
+        "INSERT OR IGNORE INTO reminders(telegram_id) SELECT telegram_id FROM users",
+    ],
+    # 6: FSM holatlari (restart va bir nechta worker uchun)
+    [
+        """
+        CREATE TABLE IF NOT EXISTS fsm_states(
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT,
+            updated_at INTEGER NOT NULL
+        ) WITHOUT ROWID""",
+        "CREATE INDEX IF NOT EXISTS ix_fsm_states_updated ON fsm_states(updated_at)",
+    ],
+    # 7: sana oralig'i bo'yicha tarixiy hisobotlar uchun indekslar
+    [
+        "CREATE INDEX IF NOT EXISTS ix_daily_sales_date ON daily_sales(telegram_id, date)",
+        "CREATE INDEX IF NOT EXISTS ix_purchases_date ON purchases(telegram_id, date)",
+        "CREATE INDEX IF NOT EXISTS ix_expenses_date ON expenses(telegram_id, date)",
+    ],
+    # 8: yopilgan davrlar surati (tarixiy hisobotlar qayta yig'masdan o'qiydi)
+    [
+        """
+        CREATE TABLE IF NOT EXISTS period_snapshots(
+            period_id INTEGER PRIMARY KEY,
+            telegram_id INTEGER NOT NULL,
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            opening INTEGER NOT NULL,
+            closing INTEGER NOT NULL,
+            cash INTEGER NOT NULL,
+            card INTEGER NOT NULL,
+            purchases INTEGER NOT NULL,
+            expenses INTEGER NOT NULL,
+            cogs INTEGER NOT NULL,
+            gross INTEGER NOT NULL,
+            net INTEGER NOT NULL,
+            closed_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )""",
+        "CREATE INDEX IF NOT EXISTS ix_period_snapshots_user ON period_snapshots(telegram_id, period_id)",
+        _SNAPSHOT_INSERT.format(where="p.is_closed=1"),
+    ],
+    # 9: muddati o'tgan ochiq davrlarni topish va taxminiy yopilish belgisi
+    [
+        "CREATE INDEX IF NOT EXISTS ix_periods_overdue ON periods(is_closed, end_date)",
+        "ALTER TABLE periods ADD COLUMN closing_estimated INTEGER NOT NULL DEFAULT 0",
+    ],
+    # 10: foydalanuvchi bo'yicha o'zgarishlar hisoblagichi (/api/sync)
+    [
+        """
+        CREATE TABLE IF NOT EXISTS user_changes(
+            telegram_id INTEGER PRIMARY KEY,
+            seq INTEGER NOT NULL DEFAULT 0
+        )""",
+        *_change_triggers("daily_sales"),
+        *_change_triggers("purchases"),
+        *_change_triggers("expenses"),
+        # davr ochilishi/yopilishi ham o'zgarish: mijoz davrni qayta oladi
+        *[
+            f"CREATE TRIGGER IF NOT EXISTS trg_periods_change_{event.lower()} AFTER {event} ON periods "
+            f"BEGIN {_bump_change(row)} END"
+            for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD"))
+        ],
+        # mavjud foydalanuvchilar 1 dan boshlaydi: seq=0 yuborgan mijoz to'liq ma'lumot oladi
+        "INSERT OR IGNORE INTO user_changes(telegram_id, seq) SELECT telegram_id, 1 FROM users",
+    ],
+]
+
+_SALE_UPSERT = """
+    INSERT INTO daily_sales(telegram_id, period_id, date, cash_amount, card_amount)
+    VALUES(?,?,?,?,?)
+    ON CONFLICT(telegram_id, period_id, date) DO UPDATE SET
+        cash_amount=excluded.cash_amount, card_amount=excluded.card_amount
+"""
+
+_SALE_UPSERT_ADD = """
+    INSERT INTO daily_sales(telegram_id, period_id, date, cash_amount, card_amount)
+    VALUES(?,?,?,?,?)
+    ON CONFLICT(telegram_id, period_id, date) DO UPDATE SET
+        cash_amount=cash_amount + excluded.cash_amount,
+        card_amount=card_amount + excluded.card_amount
+"""
+
+# batch uchun: oxirgi parametr 1 bo'lsa qo'shiladi, 0 bo'lsa almashtiriladi
+_SALE_UPSERT_FLAG = """
+    INSERT INTO daily_sales(telegram_id, period_id, date, cash_amount, card_amount)
+    VALUES(?,?,?,?,?)
+    ON CONFLICT(telegram_id, period_id, date) DO UPDATE SET
+        cash_amount=CASE WHEN ?6 THEN cash_amount + excluded.cash_amount ELSE excluded.cash_amount END,
+        card_amount=CASE WHEN ?6 THEN card_amount + excluded.card_amount ELSE excluded.card_amount END
+"""
+
+async def migrate(db):
+    # chaqiruvchi BEGIN IMMEDIATE ichida bo'lishi kerak: bir nechta jarayon
+    # bir vaqtda ishga tushsa ham migratsiya faqat bir marta bajariladi
+    cur = await db.execute("PRAGMA user_version")
+    version = (await cur.fetchone())[0]
+    for target, statements in enumerate(MIGRATIONS, start=1):
+        if target <= version:
+            continue
+        for sql in statements:
+            await db.execute(sql)
+        await db.execute(f"PRAGMA user_version={target}")
+    return len(MIGRATIONS)
+
+@db_timed
 async def db_init():
-    async with aiosqlite.connect(DB) as db:
+    async with _tx() as db:
         await db.execute("""
         CREATE TABLE IF NOT EXISTS users(
             telegram_id INTEGER PRIMARY KEY
@@ -58,16 +559,40 @@ async def db_init():
             enabled INTEGER DEFAULT 1
         )""")
 
+        await migrate(db)
 
-        await db.commit()
-
+@db_timed
 async def get_or_create_user(telegram_id: int):
-    async with aiosqlite.connect(DB) as db:
+    async with _conn() as db:
         await db.execute("INSERT OR IGNORE INTO users(telegram_id) VALUES(?)", (telegram_id,))
+        # default eslatma (21:00 ON) shu yerda yaratiladi, scheduler uni jadvaldan topadi
+        await db.execute("INSERT OR IGNORE INTO reminders(telegram_id) VALUES(?)", (telegram_id,))
         await db.commit()
 
+async def _period_version(db, telegram_id: int) -> int:
+    cur = await db.execute("SELECT version FROM period_stamps WHERE telegram_id=?", (telegram_id,))
+    row = await cur.fetchone()
+    return row[0] if row else 0
+
+@db_timed
 async def get_open_period(telegram_id: int):
-    async with aiosqlite.connect(DB) as db:
+    cached = _period_cache.get(telegram_id)
+    if cached is not None:
+        _, version, period = cached
+        if OPEN_PERIOD_CACHE_STAMP:
+            async with _conn() as db:
+                fresh = await _period_version(db, telegram_id) == version
+        else:
+            fresh = True
+        if fresh:
+            _period_cache.hits += 1
+            return dict(period) if period else None
+        _period_cache.stale += 1
+    _period_cache.misses += 1
+
+    async with _conn() as db:
+        # versiya davrdan oldin o'qiladi: oraliqda yozuv bo'lsa keyingi tekshiruv uni ushlaydi
+        version = await _period_version(db, telegram_id)
         cur = await db.execute("""
             SELECT id, start_date, end_date, opening_stock_cost, closing_stock_cost, is_closed
             FROM periods
@@ -75,9 +600,9 @@ async def get_open_period(telegram_id: int):
             ORDER BY id DESC LIMIT 1
         """, (telegram_id,))
         row = await cur.fetchone()
-        if not row:
-            return None
-        return {
+    period = None
+    if row:
+        period = {
             "id": row[0],
             "start_date": row[1],
             "end_date": row[2],
@@ -85,86 +610,619 @@ async def get_open_period(telegram_id: int):
             "closing_stock_cost": row[4],
             "is_closed": row[5],
         }
+    _period_cache.put(telegram_id, version, period)
+    return dict(period) if period else None
+
+@db_timed
+async def open_periods_for(telegram_ids: list) -> dict:
+    # ko'p foydalanuvchi uchun ochiq davrlar bitta so'rovda (eslatmalar uchun)
+    result = {}
+    async with _conn() as db:
+        for i in range(0, len(telegram_ids), 500):
+            chunk = telegram_ids[i:i + 500]
+            cur = await db.execute(f"""
+                SELECT id, start_date, end_date, opening_stock_cost, closing_stock_cost, is_closed, telegram_id
+                FROM periods
+                WHERE is_closed=0 AND telegram_id IN ({','.join('?' * len(chunk))})
+                ORDER BY telegram_id, id
+            """, chunk)
+            for row in await cur.fetchall():
+                # oxirgi (eng katta id) ochiq davr qoladi, get_open_period kabi
+                result[row[6]] = {
+                    "id": row[0],
+                    "start_date": row[1],
+                    "end_date": row[2],
+                    "opening_stock_cost": row[3],
+                    "closing_stock_cost": row[4],
+                    "is_closed": row[5],
+                }
+    return result
 
-async def create_period(telegram_id: int, start_date: str, end_date: str):
-    async with aiosqlite.connect(DB) as db:
+@db_timed
+async def create_period(telegram_id: int, start_date: str, end_date: str, opening: int = 0):
+    async with _conn() as db:
         cur = await db.execute("""
             INSERT INTO periods(telegram_id, start_date, end_date, opening_stock_cost, is_closed)
             VALUES(?,?,?,?,0)
-        """, (telegram_id, start_date, end_date, 0))
+        """, (telegram_id, start_date, end_date, opening))
         await db.commit()
-        return cur.lastrowid
+    _period_cache.invalidate(telegram_id)
+    return cur.lastrowid
 
+@db_timed
 async def set_opening_stock(period_id: int, opening: int):
-    async with aiosqlite.connect(DB) as db:
+    async with _conn() as db:
         await db.execute("UPDATE periods SET opening_stock_cost=? WHERE id=?", (opening, period_id))
         await db.commit()
+    _period_cache.invalidate_period(period_id)
 
-async def add_sale(telegram_id: int, period_id: int, d: str, cash: int, card: int):
-    async with aiosqlite.connect(DB) as db:
-        # har kunda 1 ta yozuv: bor bo'lsa update
-        cur = await db.execute("""
-            SELECT id FROM daily_sales WHERE telegram_id=? AND period_id=? AND date=?
-        """, (telegram_id, period_id, d))
-        row = await cur.fetchone()
-        if row:
-            await db.execute("""
-                UPDATE daily_sales SET cash_amount=?, card_amount=? WHERE id=?
-            """, (cash, card, row[0]))
-        else:
-            await db.execute("""
-                INSERT INTO daily_sales(telegram_id, period_id, date, cash_amount, card_amount)
-                VALUES(?,?,?,?,?)
-            """, (telegram_id, period_id, d, cash, card))
+@db_timed
+async def add_sale(telegram_id: int, period_id: int, d: str, cash: int, card: int, accumulate: bool = False):
+    # har kunda 1 ta yozuv (ux_daily_sales_day): bor bo'lsa yangilanadi.
+    # accumulate=True bo'lsa summa ustiga qo'shiladi (smena davomida bir necha marta kiritish)
+    async with _conn() as db:
+        await db.execute(_SALE_UPSERT_ADD if accumulate else _SALE_UPSERT, (telegram_id, period_id, d, cash, card))
         await db.commit()
 
+@db_timed
 async def add_purchase(telegram_id: int, period_id: int, d: str, total_cost: int, note: str):
-    async with aiosqlite.connect(DB) as db:
+    async with _conn() as db:
         await db.execute("""
             INSERT INTO purchases(telegram_id, period_id, date, total_cost, note)
             VALUES(?,?,?,?,?)
         """, (telegram_id, period_id, d, total_cost, note))
         await db.commit()
 
+@db_timed
 async def add_expense(telegram_id: int, period_id: int, d: str, amount: int, note: str):
-    async with aiosqlite.connect(DB) as db:
+    async with _conn() as db:
         await db.execute("""
             INSERT INTO expenses(telegram_id, period_id, date, amount, note)
             VALUES(?,?,?,?,?)
         """, (telegram_id, period_id, d, amount, note))
         await db.commit()
 
-async def close_period(period_id: int, closing: int):
-    async with aiosqlite.connect(DB) as db:
+async def _open_period_id(db, telegram_id: int):
+    cur = await db.execute("""
+        SELECT id FROM periods WHERE telegram_id=? AND is_closed=0 ORDER BY id DESC LIMIT 1
+    """, (telegram_id,))
+    row = await cur.fetchone()
+    return row[0] if row else None
+
+# Ochiq davrni topish va yozish bitta ulanish/tranzaksiyada: oraliqda davr
+# yopilib qololmaydi. Yozilgan davr id si, ochiq davr bo'lmasa None qaytadi.
+
+@db_timed
+async def record_sale_for_open_period(telegram_id: int, d: str, cash: int, card: int, accumulate: bool = False):
+    async with _tx() as db:
+        period_id = await _open_period_id(db, telegram_id)
+        if period_id is None:
+            return None
+        await db.execute(_SALE_UPSERT_ADD if accumulate else _SALE_UPSERT, (telegram_id, period_id, d, cash, card))
+    return period_id
+
+@db_timed
+async def record_purchase_for_open_period(telegram_id: int, d: str, total_cost: int, note: str):
+    async with _tx() as db:
+        period_id = await _open_period_id(db, telegram_id)
+        if period_id is None:
+            return None
         await db.execute("""
-            UPDATE periods SET closing_stock_cost=?, is_closed=1 WHERE id=?
-        """, (closing, period_id))
+            INSERT INTO purchases(telegram_id, period_id, date, total_cost, note)
+            VALUES(?,?,?,?,?)
+        """, (telegram_id, period_id, d, total_cost, note))
+    return period_id
+
+@db_timed
+async def record_expense_for_open_period(telegram_id: int, d: str, amount: int, note: str):
+    async with _tx() as db:
+        period_id = await _open_period_id(db, telegram_id)
+        if period_id is None:
+            return None
+        await db.execute("""
+            INSERT INTO expenses(telegram_id, period_id, date, amount, note)
+            VALUES(?,?,?,?,?)
+        """, (telegram_id, period_id, d, amount, note))
+    return period_id
+
+@db_timed
+async def apply_batch(telegram_id: int, items: list):
+    # items: [{"key", "op": sale|expense|purchase, "date", ...}] (webapp_server'da tekshirilgan).
+    # Hammasi bitta tranzaksiyada, har bir jadvalga bitta executemany bilan yoziladi.
+    # Oldin qo'llangan kalitlar qayta yozilmaydi ("duplicate"). Sanasi ochiq davr
+    # boshlanishidan oldin bo'lganlar (offline navbat davr yopilishidan oldin
+    # yig'ilgan) yozilmaydi ("closed_period"): yopilgan davr surati o'zgarmaydi.
+    async with _tx() as db:
+        cur = await db.execute("""
+            SELECT id, start_date FROM periods WHERE telegram_id=? AND is_closed=0 ORDER BY id DESC LIMIT 1
+        """, (telegram_id,))
+        row = await cur.fetchone()
+        if row is None:
+            return None, [{"key": it["key"], "status": "no_period"} for it in items]
+        period_id, start_date = row
+
+        seen = set()
+        keys = [it["key"] for it in items]
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            cur = await db.execute(
+                f"SELECT key FROM idempotency_keys WHERE telegram_id=? AND key IN ({','.join('?' * len(chunk))})",
+                (telegram_id, *chunk),
+            )
+            seen.update(r[0] for r in await cur.fetchall())
+
+        sales, purchases, expenses, new_keys, results = [], [], [], [], []
+        for it in items:
+            key = it["key"]
+            if key in seen:
+                results.append({"key": key, "status": "duplicate"})
+                continue
+            if it["date"] < start_date:
+                results.append({"key": key, "status": "closed_period"})
+                continue
+            seen.add(key)
+            if it["op"] == "sale":
+                sales.append((telegram_id, period_id, it["date"], it["cash"], it["card"], int(it["accumulate"])))
+            elif it["op"] == "purchase":
+                purchases.append((telegram_id, period_id, it["date"], it["amount"], it["note"]))
+            else:
+                expenses.append((telegram_id, period_id, it["date"], it["amount"], it["note"]))
+            new_keys.append((telegram_id, key, period_id))
+            results.append({"key": key, "status": "ok"})
+
+        if sales:
+            await db.executemany(_SALE_UPSERT_FLAG, sales)
+        if purchases:
+            await db.executemany("""
+                INSERT INTO purchases(telegram_id, period_id, date, total_cost, note) VALUES(?,?,?,?,?)
+            """, purchases)
+        if expenses:
+            await db.executemany("""
+                INSERT INTO expenses(telegram_id, period_id, date, amount, note) VALUES(?,?,?,?,?)
+            """, expenses)
+        if new_keys:
+            await db.executemany("""
+                INSERT OR IGNORE INTO idempotency_keys(telegram_id, key, period_id) VALUES(?,?,?)
+            """, new_keys)
+    return period_id, results
+
+@db_timed
+async def prune_idempotency_keys(days: int = 30):
+    async with _conn() as db:
+        cur = await db.execute(
+            "DELETE FROM idempotency_keys WHERE created_at < datetime('now', ?)", (f"-{days} days",)
+        )
         await db.commit()
+        return cur.rowcount
 
+async def _close_and_snapshot(db, period_id: int, closing: int, estimated: bool = False):
+    await db.execute("""
+        UPDATE periods SET closing_stock_cost=?, closing_estimated=?, is_closed=1 WHERE id=?
+    """, (closing, int(estimated), period_id))
+    await db.execute(_SNAPSHOT_INSERT.format(where="p.id=?"), (period_id,))
+
+@db_timed
+async def close_period(period_id: int, closing: int):
+    # yopish va surat bitta tranzaksiyada: yopilgan davr suratsiz qolmaydi
+    async with _tx() as db:
+        await _close_and_snapshot(db, period_id, closing)
+    _period_cache.invalidate_period(period_id)
+
+@db_timed
+async def rollover_period(telegram_id: int, closing: int):
+    # ochiq davrni yopish, surat va keyingi 15 kunlik davrni (opening = closing)
+    # ochish bitta tranzaksiyada. Ochiq davr bo'lmasa None.
+    async with _tx() as db:
+        period_id = await _open_period_id(db, telegram_id)
+        if period_id is None:
+            return None
+        await _close_and_snapshot(db, period_id, closing)
+        # yangi davr: oldingi end_date + 1 kundan, 15 kun
+        cur = await db.execute("""
+            INSERT INTO periods(telegram_id, start_date, end_date, opening_stock_cost, is_closed)
+            SELECT telegram_id, date(end_date, '+1 day'), date(end_date, '+15 days'), ?, 0
+            FROM periods WHERE id=?
+        """, (closing, period_id))
+        new_id = cur.lastrowid
+        cur = await db.execute(_SNAPSHOT_COLUMNS_SQL + " WHERE n.period_id=?", (period_id,))
+        snapshot = _snapshot_row(await cur.fetchone())
+        cur = await db.execute("SELECT start_date, end_date FROM periods WHERE id=?", (new_id,))
+        start_date, end_date = await cur.fetchone()
+    _period_cache.invalidate(telegram_id)
+    return {
+        "closed": snapshot,
+        "period": {
+            "id": new_id,
+            "start_date": start_date,
+            "end_date": end_date,
+            "opening_stock_cost": closing,
+            "closing_stock_cost": None,
+            "is_closed": 0,
+        },
+    }
+
+@db_timed
+async def catch_up_overdue(today: str, before: str = None, after_id: int = 0, limit: int = 500):
+    # end_date < before (default: today) bo'lgan ochiq davrlar (ix_periods_overdue), bitta partiya
+    # bitta tranzaksiyada. Har biri taxminiy yakuniy ombor (= boshlang'ich ombor)
+    # bilan yopiladi va bugunni qamraydigan davrgacha ketma-ket 15 kunlik davrlar
+    # ochiladi. (oxirgi ko'rilgan davr id, [{telegram_id, closed, period}]) qaytadi.
+    done = []
+    async with _tx() as db:
+        cur = await db.execute("""
+            SELECT id, telegram_id, end_date, COALESCE(opening_stock_cost,0)
+            FROM periods
+            WHERE is_closed=0 AND end_date<? AND id>?
+            ORDER BY id LIMIT ?
+        """, (before or today, after_id, limit))
+        rows = await cur.fetchall()
+        for period_id, telegram_id, end_date, stock in rows:
+            # foydalanuvchining oxirgi ochiq davri emas bo'lsa (eski nosozlik) tegmaymiz
+            if await _open_period_id(db, telegram_id) != period_id:
+                continue
+            closed = 0
+            end = date.fromisoformat(end_date)
+            while True:
+                await _close_and_snapshot(db, period_id, stock, estimated=True)
+                closed += 1
+                start, end = end + timedelta(days=1), end + timedelta(days=15)
+                cur = await db.execute("""
+                    INSERT INTO periods(telegram_id, start_date, end_date, opening_stock_cost, is_closed)
+                    VALUES(?,?,?,?,0)
+                """, (telegram_id, start.isoformat(), end.isoformat(), stock))
+                period_id = cur.lastrowid
+                if end.isoformat() >= today:
+                    break
+            done.append({
+                "telegram_id": telegram_id,
+                "closed": closed,
+                "period": {"id": period_id, "start_date": start.isoformat(), "end_date": end.isoformat()},
+            })
+    for item in done:
+        _period_cache.invalidate(item["telegram_id"])
+    return (rows[-1][0] if rows else after_id), done
+
+@db_timed
 async def period_totals(telegram_id: int, period_id: int):
-    async with aiosqlite.connect(DB) as db:
+    async with _conn() as db:
         cur = await db.execute("""
-            SELECT COALESCE(SUM(cash_amount),0), COALESCE(SUM(card_amount),0)
-            FROM daily_sales WHERE telegram_id=? AND period_id=?
+            SELECT cash, card, purchases, expenses
+            FROM period_summary WHERE telegram_id=? AND period_id=?
         """, (telegram_id, period_id))
-        cash, card = await cur.fetchone()
+        row = await cur.fetchone() or (0, 0, 0, 0)
+        return {"cash": row[0], "card": row[1], "purchases": row[2], "expenses": row[3]}
+
+_SNAPSHOT_COLUMNS_SQL = """
+    SELECT n.period_id, n.start_date, n.end_date, n.opening, n.closing,
+           n.cash, n.card, n.purchases, n.expenses, n.cogs, n.gross, n.net, p.closing_estimated
+    FROM period_snapshots n JOIN periods p ON p.id=n.period_id
+"""
+
+def _snapshot_row(r) -> dict:
+    return {
+        "id": r[0],
+        "start_date": r[1],
+        "end_date": r[2],
+        "opening_stock_cost": r[3],
+        "closing_stock_cost": r[4],
+        "is_closed": 1,
+        "closing_estimated": r[12],
+        "totals": {"cash": r[5], "card": r[6], "purchases": r[7], "expenses": r[8]},
+        "snapshot": {"cogs": r[9], "gross": r[10], "net": r[11]},
+    }
+
+@db_timed
+async def get_snapshot(period_id: int):
+    async with _conn() as db:
+        cur = await db.execute(_SNAPSHOT_COLUMNS_SQL + " WHERE n.period_id=?", (period_id,))
+        row = await cur.fetchone()
+    return _snapshot_row(row) if row else None
 
+@db_timed
+async def period_history(telegram_id: int, after_id: int = 0):
+    # foydalanuvchining id > after_id bo'lgan barcha davrlari, id bo'yicha tartibda.
+    # Yopilganlari period_snapshots dan tayyor holda, ochiqlari period_summary dan.
+    # (period_stamps versiyasi, davrlar) qaytadi: versiya kesh tekshiruvi uchun.
+    async with _conn() as db:
+        version = await _period_version(db, telegram_id)
+        cur = await db.execute(
+            _SNAPSHOT_COLUMNS_SQL + " WHERE n.telegram_id=? AND n.period_id>? ORDER BY n.period_id",
+            (telegram_id, after_id),
+        )
+        closed = [_snapshot_row(r) for r in await cur.fetchall()]
         cur = await db.execute("""
-            SELECT COALESCE(SUM(total_cost),0)
-            FROM purchases WHERE telegram_id=? AND period_id=?
-        """, (telegram_id, period_id))
-        purchases = (await cur.fetchone())[0]
+            SELECT p.id, p.start_date, p.end_date, p.opening_stock_cost, p.closing_stock_cost, p.is_closed,
+                   COALESCE(s.cash,0), COALESCE(s.card,0), COALESCE(s.purchases,0), COALESCE(s.expenses,0)
+            FROM periods p
+            LEFT JOIN period_summary s ON s.telegram_id=p.telegram_id AND s.period_id=p.id
+            WHERE p.telegram_id=? AND p.id>?
+              AND NOT EXISTS (SELECT 1 FROM period_snapshots n WHERE n.period_id=p.id)
+            ORDER BY p.id
+        """, (telegram_id, after_id))
+        rows = await cur.fetchall()
+    live = [
+        {
+            "id": r[0],
+            "start_date": r[1],
+            "end_date": r[2],
+            "opening_stock_cost": r[3],
+            "closing_stock_cost": r[4],
+            "is_closed": r[5],
+            "closing_estimated": 0,
+            "totals": {"cash": r[6], "card": r[7], "purchases": r[8], "expenses": r[9]},
+        }
+        for r in rows
+    ]
+    return version, sorted(closed + live, key=lambda p: p["id"])
 
+@db_timed
+async def range_totals(telegram_id: int, start: str, end: str):
+    # [start, end] sanalari oralig'idagi yozuvlar, davr bo'yicha guruhlangan:
+    # bitta o'tish, har bir jadvalda (telegram_id, date) indeksi bo'yicha
+    async with _conn() as db:
         cur = await db.execute("""
-            SELECT COALESCE(SUM(amount),0)
-            FROM expenses WHERE telegram_id=? AND period_id=?
+            SELECT period_id, SUM(cash), SUM(card), SUM(purchases), SUM(expenses)
+            FROM (
+                SELECT period_id, COALESCE(cash_amount,0) AS cash, COALESCE(card_amount,0) AS card,
+                       0 AS purchases, 0 AS expenses
+                FROM daily_sales WHERE telegram_id=? AND date BETWEEN ? AND ?
+                UNION ALL
+                SELECT period_id, 0, 0, COALESCE(total_cost,0), 0
+                FROM purchases WHERE telegram_id=? AND date BETWEEN ? AND ?
+                UNION ALL
+                SELECT period_id, 0, 0, 0, COALESCE(amount,0)
+                FROM expenses WHERE telegram_id=? AND date BETWEEN ? AND ?
+            )
+            GROUP BY period_id
+        """, (telegram_id, start, end) * 3)
+        return {
+            r[0]: {"cash": r[1], "card": r[2], "purchases": r[3], "expenses": r[4]}
+            for r in await cur.fetchall()
+        }
+
+# Import: sanalarni davrlarga taqsimlash. Davrlar [start, end, id, is_closed]
+# ko'rinishida start bo'yicha tartiblangan; qamrab olinmagan sana uchun qo'shni
+# davrlarga tutashgan 15 kunlik o'tgan davr rejalashtiriladi (id=None).
+def _assign_periods(periods: list, dates: list):
+    starts = [p[0] for p in periods]
+    assign, created = {}, []
+    day = timedelta(days=1)
+    for d in dates:
+        i = bisect.bisect_right(starts, d) - 1
+        lower = periods[i] if i >= 0 else None
+        upper = periods[i + 1] if i + 1 < len(periods) else None
+        if lower is not None and d <= lower[1]:
+            assign[d] = lower
+            continue
+        if lower is not None and upper is None and not lower[3]:
+            # muddati o'tgan ochiq davr: handlerlar kabi shu davrga yoziladi
+            assign[d] = lower
+            continue
+
+        dd = date.fromisoformat(d)
+        if lower is None and upper is not None:
+            # birinchi davrdan oldin: orqaga qarab 15 kunlik zanjir
+            anchor = date.fromisoformat(upper[0]) - day
+            end = anchor - timedelta(days=15 * ((anchor - dd).days // 15))
+            start = end - timedelta(days=14)
+        else:
+            anchor = date.fromisoformat(lower[1]) + day if lower is not None else dd
+            start = anchor + timedelta(days=15 * ((dd - anchor).days // 15))
+            end = start + timedelta(days=14)
+        if upper is not None:
+            end = min(end, date.fromisoformat(upper[0]) - day)
+        if lower is not None:
+            start = max(start, date.fromisoformat(lower[1]) + day)
+
+        period = [start.isoformat(), end.isoformat(), None, 1]
+        periods.insert(i + 1, period)
+        starts.insert(i + 1, period[0])
+        created.append(period)
+        assign[d] = period
+    return assign, created
+
+@db_timed
+async def import_ledger(telegram_id: int, rows: list, chunk: int = 10000):
+    # rows: (tur, sana, naqd, karta, summa, izoh) — tekshirilgan qatorlar.
+    # Yetishmayan o'tgan davrlar yopilgan (yakuniy ombor taxminiy) holda yaratiladi,
+    # yozuvlar `chunk` talik executemany tranzaksiyalarida qo'shiladi, oxirida
+    # ta'sirlangan yopilgan davrlar surati yangilanadi. Bir kunning bir nechta savdo
+    # qatori qo'shib yoziladi; bazada savdosi bor kunlar ustidan yozilmaydi, ularning
+    # qatorlari "skipped" da (rows dagi indekslar) qaytadi.
+    # Ochiq davr bo'lmasa None: aks holda yaratilgan davrlar bugundan o'tib ketib,
+    # keyingi /start ochadigan davr bilan ustma-ust tushishi mumkin.
+    async with _tx() as db:
+        cur = await db.execute("""
+            SELECT start_date, end_date, id, is_closed FROM periods WHERE telegram_id=? ORDER BY start_date, id
+        """, (telegram_id,))
+        periods = [list(r) for r in await cur.fetchall()]
+        if all(p[3] for p in periods):
+            return None
+        assign, created = _assign_periods(periods, sorted({r[1] for r in rows}))
+        for period in created:
+            cur = await db.execute("""
+                INSERT INTO periods(telegram_id, start_date, end_date, opening_stock_cost,
+                                    closing_stock_cost, closing_estimated, is_closed)
+                VALUES(?,?,?,0,0,1,1)
+            """, (telegram_id, period[0], period[1]))
+            period[2] = cur.lastrowid
+        existing = set()
+        sale_days = sorted({r[1] for r in rows if r[0] == "sale"})
+        if sale_days:
+            cur = await db.execute("""
+                SELECT DISTINCT date FROM daily_sales WHERE telegram_id=? AND date BETWEEN ? AND ?
+            """, (telegram_id, sale_days[0], sale_days[-1]))
+            existing = {r[0] for r in await cur.fetchall()}
+
+    touched, skipped = set(), []
+    for i in range(0, len(rows), chunk):
+        sales, purchases, expenses = [], [], []
+        for n, (kind, d, cash, card, amount, note) in enumerate(rows[i:i + chunk], start=i):
+            if kind == "sale" and d in existing:
+                skipped.append(n)
+                continue
+            period_id = assign[d][2]
+            touched.add(period_id)
+            if kind == "sale":
+                sales.append((telegram_id, period_id, d, cash, card))
+            elif kind == "purchase":
+                purchases.append((telegram_id, period_id, d, amount, note))
+            else:
+                expenses.append((telegram_id, period_id, d, amount, note))
+        # har bo'lak alohida tranzaksiya: bot va web app yozuvlari orada o'tib oladi
+        async with _tx() as db:
+            await db.executemany(_SALE_UPSERT_ADD, sales)
+            await db.executemany("""
+                INSERT INTO purchases(telegram_id, period_id, date, total_cost, note) VALUES(?,?,?,?,?)
+            """, purchases)
+            await db.executemany("""
+                INSERT INTO expenses(telegram_id, period_id, date, amount, note) VALUES(?,?,?,?,?)
+            """, expenses)
+
+    closed_ids = [p[2] for p in periods if p[3] and p[2] in touched]
+    async with _tx() as db:
+        for i in range(0, len(closed_ids), 500):
+            part = closed_ids[i:i + 500]
+            await db.execute(_SNAPSHOT_INSERT.format(where=f"p.id IN ({','.join('?' * len(part))})"), part)
+        # yopilgan davrlar o'zgardi: boshqa jarayonlardagi tarix keshi ham yangilansin
+        await db.execute("""
+            INSERT INTO period_stamps(telegram_id, version) VALUES(?, 1)
+            ON CONFLICT(telegram_id) DO UPDATE SET version=version+1
+        """, (telegram_id,))
+    _period_cache.invalidate(telegram_id)
+    return {
+        "rows": len(rows) - len(skipped),
+        "skipped": skipped,
+        "periods_created": len(created),
+        "periods_touched": len(touched),
+    }
+
+# Eksport: (tur, sana, davr, naqd, karta, summa, izoh) qatorlari
+_LEDGER_SQL = {
+    "sale": """
+        SELECT 'sale', date, period_id, COALESCE(cash_amount,0), COALESCE(card_amount,0),
+               COALESCE(cash_amount,0) + COALESCE(card_amount,0), NULL
+        FROM daily_sales WHERE {where} ORDER BY date, id
+    """,
+    "purchase": """
+        SELECT 'purchase', date, period_id, NULL, NULL, COALESCE(total_cost,0), note
+        FROM purchases WHERE {where} ORDER BY date, id
+    """,
+    "expense": """
+        SELECT 'expense', date, period_id, NULL, NULL, COALESCE(amount,0), note
+        FROM expenses WHERE {where} ORDER BY date, id
+    """,
+}
+
+async def _connect_readonly():
+    # alohida faqat-o'qish ulanishi: uzoq eksport pool ulanishini band qilmaydi
+    # va yozish qulfini olmaydi (WAL: yozuvchilar kutmaydi)
+    conn = aiosqlite.connect(f"file:{DB}?mode=ro", uri=True, timeout=STORAGE_PROFILE["busy_timeout"] / 1000)
+    conn.daemon = True
+    await conn
+    await conn.execute("PRAGMA query_only=1")
+    for name in ("busy_timeout", "cache_size", "mmap_size", "temp_store"):
+        await conn.execute(f"PRAGMA {name}={STORAGE_PROFILE[name]}")
+    return conn
+
+async def iter_ledger(telegram_id: int, period_id: int = None, start: str = None, end: str = None,
+                      chunk: int = 1000):
+    # barcha yozuvlar fetchmany bo'laklarida (har yield = ko'pi bilan `chunk` ta qator):
+    # tarix qancha katta bo'lmasin xotira sarfi bir xil. Jadvallar ketma-ket,
+    # har biri (telegram_id, date) indeksi tartibida o'qiladi (saralash yo'q).
+    where, params = ["telegram_id=?"], [telegram_id]
+    if period_id is not None:
+        where.append("period_id=?")
+        params.append(period_id)
+    if start:
+        where.append("date>=?")
+        params.append(start)
+    if end:
+        where.append("date<=?")
+        params.append(end)
+
+    conn = await _connect_readonly()
+    try:
+        for sql in _LEDGER_SQL.values():
+            cur = await conn.execute(sql.format(where=" AND ".join(where)), params)
+            while True:
+                rows = await cur.fetchmany(chunk)
+                if not rows:
+                    break
+                yield rows
+            await cur.close()
+    finally:
+        await conn.close()
+
+@db_timed
+async def sync_changes(telegram_id: int, period_id: int, since: int = 0):
+    # joriy seq; since dan keyin o'zgargan bo'lsa davr yig'indisi va davrdagi
+    # change_seq > since yozuvlar ham (ix_*_change indeksi bo'yicha).
+    # since=0: to'liq holat (davrning barcha yozuvlari)
+    async with _conn() as db:
+        cur = await db.execute("SELECT seq FROM user_changes WHERE telegram_id=?", (telegram_id,))
+        row = await cur.fetchone()
+        seq = row[0] if row else 0
+        if since > 0 and seq == since:
+            return {"seq": seq, "modified": False}
+
+        cur = await db.execute("""
+            SELECT cash, card, purchases, expenses
+            FROM period_summary WHERE telegram_id=? AND period_id=?
         """, (telegram_id, period_id))
-        expenses = (await cur.fetchone())[0]
+        t = await cur.fetchone() or (0, 0, 0, 0)
+        cur = await db.execute("""
+            SELECT 'sale', id, date, cash_amount, card_amount, NULL, NULL, change_seq
+            FROM daily_sales WHERE telegram_id=? AND change_seq>? AND period_id=?
+            UNION ALL
+            SELECT 'purchase', id, date, NULL, NULL, total_cost, note, change_seq
+            FROM purchases WHERE telegram_id=? AND change_seq>? AND period_id=?
+            UNION ALL
+            SELECT 'expense', id, date, NULL, NULL, amount, note, change_seq
+            FROM expenses WHERE telegram_id=? AND change_seq>? AND period_id=?
+            ORDER BY 8
+        """, (telegram_id, since if since > 0 else -1, period_id) * 3)
+        entries = [
+            {"type": r[0], "id": r[1], "date": r[2], "cash": r[3], "card": r[4], "amount": r[5], "note": r[6], "seq": r[7]}
+            for r in await cur.fetchall()
+        ]
+    return {
+        "seq": seq,
+        "modified": True,
+        "totals": {"cash": t[0], "card": t[1], "purchases": t[2], "expenses": t[3]},
+        "entries": entries,
+    }
+
+@db_timed
+async def rebuild_period_summary():
+    # period_summary ni xom yozuvlardan qaytadan hisoblaydi
+    async with _tx() as db:
+        await db.execute("DELETE FROM period_summary")
+        cur = await db.execute(
+            "INSERT INTO period_summary(telegram_id, period_id, cash, card, purchases, expenses) " + _SUMMARY_FROM_RAW
+        )
+        return cur.rowcount
 
-        return {"cash": cash, "card": card, "purchases": purchases, "expenses": expenses}
+@db_timed
+async def verify_period_summary():
+    # period_summary va xom yozuvlar orasidagi farqlar ro'yxati (bo'sh = hammasi to'g'ri)
+    async with _conn() as db:
+        cur = await db.execute(_SUMMARY_FROM_RAW)
+        raw = {(r[0], r[1]): tuple(r[2:]) for r in await cur.fetchall()}
+        cur = await db.execute("SELECT telegram_id, period_id, cash, card, purchases, expenses FROM period_summary")
+        stored = {(r[0], r[1]): tuple(r[2:]) for r in await cur.fetchall()}
 
+    zero = (0, 0, 0, 0)
+    drift = []
+    for key in sorted(raw.keys() | stored.keys()):
+        expected, actual = raw.get(key, zero), stored.get(key, zero)
+        if expected != actual:
+            drift.append({"telegram_id": key[0], "period_id": key[1], "expected": expected, "actual": actual})
+    return drift
+
+@db_timed
 async def get_reminder(telegram_id: int):
-    async with aiosqlite.connect(DB) as db:
+    async with _conn() as db:
         cur = await db.execute("SELECT hour, minute, enabled FROM reminders WHERE telegram_id=?", (telegram_id,))
         row = await cur.fetchone()
         if not row:
@@ -174,14 +1232,108 @@ async def get_reminder(telegram_id: int):
             return {"hour": 21, "minute": 0, "enabled": 1}
         return {"hour": row[0], "minute": row[1], "enabled": row[2]}
 
+@db_timed
 async def set_reminder(telegram_id: int, hour: int, minute: int, enabled: int):
-    async with aiosqlite.connect(DB) as db:
+    async with _conn() as db:
         await db.execute("""
             INSERT INTO reminders(telegram_id, hour, minute, enabled)
             VALUES(?,?,?,?)
             ON CONFLICT(telegram_id) DO UPDATE SET hour=excluded.hour, minute=excluded.minute, enabled=excluded.enabled
         """, (telegram_id, hour, minute, enabled))
         await db.commit()
+    for callback in _reminder_listeners:
+        result = callback(telegram_id, hour, minute, enabled)
+        if inspect.isawaitable(result):
+            await result
 
+@db_timed
 async def get_reminders(telegram_id: int):
     return await get_reminder(telegram_id)
+
+# set_reminder o'zgarishlarini kuzatuvchilar (masalan, ReminderScheduler):
+# callback(telegram_id, hour, minute, enabled), oddiy yoki async funksiya
+_reminder_listeners = []
+
+def on_reminder_change(callback):
+    _reminder_listeners.append(callback)
+    return callback
+
+@db_timed
+async def reminder_slots():
+    # yoqilgan eslatmalar bor bo'lgan (soat, daqiqa) juftliklari
+    async with _conn() as db:
+        cur = await db.execute("SELECT DISTINCT hour, minute FROM reminders WHERE enabled=1")
+        return [(r[0], r[1]) for r in await cur.fetchall()]
+
+@db_timed
+async def reminder_recipients(hour: int, minute: int, after_id: int = 0, limit: int = 1000):
+    # keyset sahifalash: keyingi sahifa uchun oxirgi telegram_id ni after_id qilib bering
+    async with _conn() as db:
+        cur = await db.execute("""
+            SELECT telegram_id FROM reminders
+            WHERE enabled=1 AND hour=? AND minute=? AND telegram_id>?
+            ORDER BY telegram_id LIMIT ?
+        """, (hour, minute, after_id, limit))
+        return [r[0] for r in await cur.fetchall()]
+
+# --- FSM holatlari (fsm_storage.SQLiteStorage uchun) ---
+
+@db_timed
+async def fsm_get(key: str, ttl: int = 0):
+    # (state, data_json) yoki None; ttl dan eski yozuvlar yo'q hisoblanadi
+    async with _conn() as db:
+        cur = await db.execute("SELECT state, data, updated_at FROM fsm_states WHERE key=?", (key,))
+        row = await cur.fetchone()
+    if not row or (ttl > 0 and row[2] < time.time() - ttl):
+        return None
+    return row[0], row[1]
+
+@db_timed
+async def fsm_set_state(key: str, state):
+    async with _conn() as db:
+        await db.execute("""
+            INSERT INTO fsm_states(key, state, data, updated_at) VALUES(?,?,NULL,?)
+            ON CONFLICT(key) DO UPDATE SET state=excluded.state, updated_at=excluded.updated_at
+        """, (key, state, int(time.time())))
+        await db.execute("DELETE FROM fsm_states WHERE key=? AND state IS NULL AND data IS NULL", (key,))
+        await db.commit()
+
+@db_timed
+async def fsm_set_data(key: str, data):
+    # data: JSON matn yoki None (bo'sh)
+    async with _conn() as db:
+        await db.execute("""
+            INSERT INTO fsm_states(key, state, data, updated_at) VALUES(?,NULL,?,?)
+            ON CONFLICT(key) DO UPDATE SET data=excluded.data, updated_at=excluded.updated_at
+        """, (key, data, int(time.time())))
+        await db.execute("DELETE FROM fsm_states WHERE key=? AND state IS NULL AND data IS NULL", (key,))
+        await db.commit()
+
+@db_timed
+async def fsm_cleanup(ttl: int):
+    async with _conn() as db:
+        cur = await db.execute("DELETE FROM fsm_states WHERE updated_at < ?", (int(time.time()) - ttl,))
+        await db.commit()
+        return cur.rowcount
+
+
+async def _cli(command: str):
+    await db_init()
+    try:
+        if command == "verify":
+            drift = await verify_period_summary()
+            for d in drift:
+                print(d)
+            print(f"period_summary: {len(drift)} ta farq")
+        elif command == "rebuild":
+            print(f"period_summary: {await rebuild_period_summary()} ta qator qayta hisoblandi")
+        elif command == "checkpoint":
+            print(await wal_checkpoint("TRUNCATE"))
+        else:
+            raise SystemExit("foydalanish: python db.py verify|rebuild|checkpoint")
+    finally:
+        await db_close()
+
+if __name__ == "__main__":
+    import sys
+    asyncio.run(_cli(sys.argv[1] if len(sys.argv) > 1 else ""))
@@ -0,0 +1,97 @@
+import io
+import os
+import csv
+import hmac
+import time
+import base64
+import hashlib
+from datetime import date
+
+import db as db_api
+
+# Buxgalteriya uchun eksport: barcha savdo/kirim/chiqim yozuvlari CSV ko'rinishida.
+# Qatorlar db.iter_ledger dan bo'laklab o'qiladi va darhol yoziladi, shuning uchun
+# xotira sarfi tarix hajmiga bog'liq emas.
+
+EXPORT_COLUMNS = ("type", "date", "period_id", "cash", "card", "amount", "note")
+# Excel UTF-8 ni to'g'ri ochishi uchun
+CSV_BOM = "\ufeff".encode()
+# Yuklab olish havolasi: initData URL ga (access log, proxy, brauzer tarixi)
+# tushmasligi uchun uning o'rniga qisqa muddatli imzolangan token
+EXPORT_LINK_TTL = int(os.getenv("EXPORT_LINK_TTL", "300"))  # soniya
+
+
+def parse_filters(start=None, end=None, period=None) -> dict:
+    # noto'g'ri qiymat uchun ValueError/TypeError
+    filters = {}
+    if start:
+        filters["start"] = date.fromisoformat(str(start)).isoformat()
+    if end:
+        filters["end"] = date.fromisoformat(str(end)).isoformat()
+    if start and end and filters["start"] > filters["end"]:
+        raise ValueError("start > end")
+    if period not in (None, ""):
+        filters["period_id"] = int(period)
+    return filters
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+def _signature(secret: str, payload: bytes) -> bytes:
+    key = hashlib.sha256(b"autohisob-export:" + secret.encode()).digest()
+    return hmac.new(key, payload, hashlib.sha256).digest()
+
+def sign_link(secret: str, telegram_id: int, filters: dict, ttl: int = EXPORT_LINK_TTL) -> str:
+    # token: foydalanuvchi, muddat va filtrlar + HMAC (secret = BOT_TOKEN)
+    fields = (telegram_id, int(time.time()) + ttl,
+              filters.get("start", ""), filters.get("end", ""), filters.get("period_id", ""))
+    payload = "|".join(str(f) for f in fields).encode()
+    return f"{_b64(payload)}.{_b64(_signature(secret, payload))}"
+
+def verify_link(secret: str, token: str):
+    # (telegram_id, filters); imzo noto'g'ri yoki muddati o'tgan bo'lsa None
+    try:
+        payload_b64, sig_b64 = token.split(".")
+        payload = base64.urlsafe_b64decode(payload_b64 + "=" * (-len(payload_b64) % 4))
+        sig = base64.urlsafe_b64decode(sig_b64 + "=" * (-len(sig_b64) % 4))
+    except ValueError:
+        return None
+    if not hmac.compare_digest(sig, _signature(secret, payload)):
+        return None
+    telegram_id, expires, start, end, period = payload.decode().split("|")
+    if int(expires) < time.time():
+        return None
+    return int(telegram_id), parse_filters(start, end, period)
+
+
+def export_filename(telegram_id: int, filters: dict) -> str:
+    if "period_id" in filters:
+        suffix = f"davr{filters['period_id']}"
+    else:
+        suffix = f"{filters.get('start', 'boshi')}_{filters.get('end', 'oxiri')}"
+    return f"autohisob_{telegram_id}_{suffix}.csv"
+
+
+async def csv_chunks(telegram_id: int, chunk: int = 1000, **filters):
+    # bytes bo'laklari: birinchisi sarlavha, keyin har fetchmany uchun bittadan
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_COLUMNS)
+    yield CSV_BOM + buf.getvalue().encode()
+
+    async for rows in db_api.iter_ledger(telegram_id, chunk=chunk, **filters):
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows(rows)
+        yield buf.getvalue().encode()
+
+
+async def write_csv(path: str, telegram_id: int, **filters) -> int:
+    # bot hujjat sifatida yuborishi uchun faylga; yozilgan baytlar soni
+    size = 0
+    with open(path, "wb") as f:
+        async for data in csv_chunks(telegram_id, **filters):
+            f.write(data)
+            size += len(data)
+    return size
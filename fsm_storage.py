@@ -0,0 +1,67 @@
+import os
+import json
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+import db as db_api
+
+# FSM_STORAGE: sqlite (default) | redis | memory
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sqlite").strip().lower()
+# yarim kiritilgan yozuv shuncha soniyadan keyin unutiladi
+FSM_TTL = int(os.getenv("FSM_TTL", str(24 * 3600)))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+class SQLiteStorage(BaseStorage):
+    # Holatlar data.db dagi fsm_states jadvalida: bot qayta ishga tushsa ham
+    # va bir nechta worker bitta bazani ishlatsa ham yo'qolmaydi.
+    def __init__(self, ttl: int = FSM_TTL):
+        self.ttl = ttl
+
+    @staticmethod
+    def build_key(key: StorageKey) -> str:
+        parts = [key.bot_id, key.chat_id, key.user_id, key.thread_id or "", key.destiny]
+        business = getattr(key, "business_connection_id", None)
+        if business:
+            parts.append(business)
+        return ":".join(str(p) for p in parts)
+
+    async def set_state(self, key: StorageKey, state=None) -> None:
+        if isinstance(state, State):
+            state = state.state
+        await db_api.fsm_set_state(self.build_key(key), state)
+
+    async def get_state(self, key: StorageKey):
+        row = await db_api.fsm_get(self.build_key(key), self.ttl)
+        return row[0] if row else None
+
+    async def set_data(self, key: StorageKey, data) -> None:
+        payload = json.dumps(dict(data), ensure_ascii=False) if data else None
+        await db_api.fsm_set_data(self.build_key(key), payload)
+
+    async def get_data(self, key: StorageKey) -> dict:
+        row = await db_api.fsm_get(self.build_key(key), self.ttl)
+        if not row or not row[1]:
+            return {}
+        return json.loads(row[1])
+
+    async def cleanup(self) -> int:
+        return await db_api.fsm_cleanup(self.ttl)
+
+    async def close(self) -> None:
+        # ulanishlar db pool'iniki, ularni db_close yopadi
+        pass
+
+
+def make_storage() -> BaseStorage:
+    if FSM_STORAGE == "memory":
+        return MemoryStorage()
+    if FSM_STORAGE == "redis":
+        # `redis` paketi kerak; Redis protokolini tushunadigan istalgan server
+        # (redis-server, KeyDB, lokal sinov uchun fakeredis) ishlaydi
+        from aiogram.fsm.storage.redis import RedisStorage
+
+        return RedisStorage.from_url(REDIS_URL, state_ttl=FSM_TTL, data_ttl=FSM_TTL)
+    return SQLiteStorage()
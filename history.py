@@ -0,0 +1,149 @@
+import os
+from collections import OrderedDict
+
+import db as db_api
+from metrics import cache_collector
+from reports import period_figures
+
+# Yopilgan davrlar o'zgarmaydi: ular foydalanuvchi bo'yicha keshda turadi va
+# keyingi so'rovlarda faqat yangi (id > oxirgi yopilgan id) davrlar o'qiladi.
+# period_stamps versiyasi o'zgarsa (davr yopildi, import) kesh to'liq yangilanadi.
+HISTORY_CACHE_USERS = int(os.getenv("HISTORY_CACHE_USERS", "1000"))
+
+
+class ClosedPeriodCache:
+    # LRU: telegram_id -> (versiya, oxirgi yopilgan davr id, [yopilgan davrlar])
+    def __init__(self, size: int = HISTORY_CACHE_USERS):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+
+    def get(self, telegram_id: int):
+        item = self._items.get(telegram_id)
+        if item is None:
+            self.misses += 1
+            return None, 0, []
+        self.hits += 1
+        self._items.move_to_end(telegram_id)
+        return item
+
+    def put(self, telegram_id: int, version: int, last_id: int, closed: list):
+        if self.size <= 0:
+            return
+        self._items[telegram_id] = (version, last_id, closed)
+        self._items.move_to_end(telegram_id)
+        while len(self._items) > self.size:
+            self._items.popitem(last=False)
+
+    def invalidate(self, telegram_id: int):
+        self._items.pop(telegram_id, None)
+
+    def clear(self):
+        self._items.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+_closed_cache = ClosedPeriodCache()
+
+def cache_stats() -> dict:
+    return {"history": _closed_cache.stats()}
+
+cache_collector(cache_stats)
+
+def invalidate(telegram_id: int):
+    # yopilgan davrlarga yozuv qo'shilsa/o'zgarsa (masalan import) chaqiriladi
+    _closed_cache.invalidate(telegram_id)
+
+
+def _with_figures(period: dict) -> dict:
+    closed = bool(period["is_closed"])
+    figures = period_figures(period, period["totals"], closed)
+    # yopilgan davr: foyda period_snapshots da yopish paytida hisoblangan
+    figures.update(period.get("snapshot") or {})
+    return {**period, "closed": closed, "figures": figures}
+
+async def all_periods(telegram_id: int) -> list:
+    # yopilganlar keshdan, qolganlari (ochiq davr va undan keyingilar) bazadan
+    cached_version, last_id, closed = _closed_cache.get(telegram_id)
+    version, rows = await db_api.period_history(telegram_id, after_id=last_id)
+    if last_id and version != cached_version:
+        last_id, closed = 0, []
+        version, rows = await db_api.period_history(telegram_id)
+
+    live = []
+    new_closed = []
+    for row in rows:
+        # kursor faqat uzluksiz yopilgan davrlar bo'yicha suriladi
+        if row["is_closed"] and not live:
+            new_closed.append(_with_figures(row))
+        else:
+            live.append(_with_figures(row))
+
+    if new_closed:
+        closed = closed + new_closed
+        last_id = new_closed[-1]["id"]
+    _closed_cache.put(telegram_id, version, last_id, closed)
+    # import o'tgan davrlarni keyinroq id bilan yaratadi: sana bo'yicha tartib
+    return sorted(closed + live, key=lambda p: (p["start_date"], p["id"]))
+
+
+def _sum_totals(periods: list) -> dict:
+    t = {"cash": 0, "card": 0, "purchases": 0, "expenses": 0, "cogs": None, "gross": None, "net": None}
+    for p in periods:
+        fig = p["figures"]
+        for k in ("cash", "card", "purchases", "expenses"):
+            t[k] += fig[k]
+        if fig["cogs"] is not None:
+            for k in ("cogs", "gross", "net"):
+                t[k] = (t[k] or 0) + fig[k]
+    t["sales"] = t["cash"] + t["card"]
+    # foyda barcha davrlar bo'yicha hisoblanganmi
+    t["complete"] = all(p["figures"]["cogs"] is not None for p in periods)
+    return t
+
+async def period_report(telegram_id: int, limit: int = 0) -> dict:
+    # oxirgi `limit` ta davr (0 = hammasi) va ularning umumiy yig'indisi
+    periods = await all_periods(telegram_id)
+    if limit > 0:
+        periods = periods[-limit:]
+    if not periods:
+        return None
+    return {
+        "start": periods[0]["start_date"],
+        "end": periods[-1]["end_date"],
+        "periods": periods,
+        "totals": _sum_totals(periods),
+    }
+
+async def range_report(telegram_id: int, start: str, end: str) -> dict:
+    # [start, end] oralig'i: savdo/kirim/chiqim sanasi bo'yicha aniq yig'iladi,
+    # COGS va foyda esa faqat oraliq ichiga to'liq tushgan yopilgan davrlardan
+    if start > end:
+        raise ValueError("start > end")
+    by_period = await db_api.range_totals(telegram_id, start, end)
+    empty = {"cash": 0, "card": 0, "purchases": 0, "expenses": 0}
+
+    periods = []
+    for p in await all_periods(telegram_id):
+        overlaps = p["start_date"] <= end and p["end_date"] >= start
+        # muddati o'tib ketgan ochiq davrga yozilgan sanalar ham hisobga olinsin
+        if not overlaps and p["id"] not in by_period:
+            continue
+        inside = start <= p["start_date"] and p["end_date"] <= end
+        if inside:
+            periods.append(p)
+            continue
+        # qisman kesishgan davr: faqat oraliqdagi yozuvlar, foyda yo'q
+        part = {**p, "closing_stock_cost": None, "totals": by_period.get(p["id"], empty)}
+        periods.append({**part, "figures": period_figures(part, part["totals"], False)})
+
+    return {"start": start, "end": end, "periods": periods, "totals": _sum_totals(periods)}
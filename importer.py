@@ -0,0 +1,101 @@
+import os
+import csv
+import time
+import asyncio
+from datetime import date
+
+import db as db_api
+import history
+from schemas import amount as parse_amount
+
+# Qog'oz/Excel dan o'tayotgan do'konlar uchun CSV import. Format eksport bilan
+# bir xil (export.EXPORT_COLUMNS): type,date,cash,card,amount,note
+# (period_id ustuni bo'lsa e'tiborga olinmaydi, davr sana bo'yicha topiladi).
+IMPORT_CHUNK = int(os.getenv("IMPORT_CHUNK", "10000"))
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "100"))  # javobda ko'rsatiladigan xatolar
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", str(20 * 1024 * 1024)))  # bot API yuklab olish limiti
+
+KINDS = {
+    "sale": "sale", "savdo": "sale",
+    "purchase": "purchase", "kirim": "purchase",
+    "expense": "expense", "chiqim": "expense",
+}
+
+
+def parse_row(row: dict, today: str) -> tuple:
+    # noto'g'ri qator uchun ValueError
+    kind = KINDS.get(str(row.get("type") or "").strip().lower())
+    if kind is None:
+        raise ValueError("type noto'g'ri (sale/purchase/expense)")
+    try:
+        d = date.fromisoformat(str(row.get("date") or "").strip()).isoformat()
+    except ValueError:
+        raise ValueError("sana noto'g'ri (YYYY-MM-DD)")
+    if d > today:
+        raise ValueError("sana kelajakda")
+    # summalar /api/* bilan bir xil qoidalar bo'yicha (schemas.amount, ValidationError ham ValueError)
+    if kind == "sale":
+        cash, card = parse_amount(row, "cash"), parse_amount(row, "card")
+        return kind, d, cash, card, cash + card, None
+    return kind, d, None, None, parse_amount(row, "amount"), str(row.get("note") or "-").strip() or "-"
+
+
+def parse_csv(lines, today: str):
+    # lines: matn qatorlari (fayl obyekti ham bo'ladi).
+    # (qatorlar, ularning fayldagi raqamlari, xatolar, jami)
+    rows, line_nums, errors, total = [], [], [], 0
+    reader = csv.DictReader(lines)
+    for row in reader:
+        total += 1
+        try:
+            rows.append(parse_row(row, today))
+            line_nums.append(reader.line_num)
+        except ValueError as e:
+            errors.append({"line": reader.line_num, "err": str(e)})
+    return rows, line_nums, errors, total
+
+
+async def import_csv(telegram_id: int, lines, today: str) -> dict:
+    # ochiq davr bo'lmasa None (avval /start)
+    started = time.perf_counter()
+    # 100k+ qatorni tahlil qilish event loop'ni to'smasin
+    rows, line_nums, errors, total = await asyncio.to_thread(parse_csv, lines, today)
+    parsed = time.perf_counter()
+
+    result = {"rows": 0, "periods_created": 0, "periods_touched": 0}
+    if rows:
+        result = await db_api.import_ledger(telegram_id, rows, chunk=IMPORT_CHUNK)
+        if result is None:
+            return None  # ochiq davr yo'q
+        # yopilgan davrlar o'zgardi: tarix keshi qayta o'qilsin
+        history.invalidate(telegram_id)
+        # bazada savdosi bor kunlar ustidan yozilmadi: qator xatosi sifatida
+        errors += [{"line": line_nums[i], "err": "bu kun savdosi allaqachon kiritilgan"}
+                   for i in result.pop("skipped")]
+        errors.sort(key=lambda e: e["line"])
+
+    elapsed = time.perf_counter() - started
+    return {
+        **result,
+        "total": total,
+        "failed": len(errors),
+        "errors": errors[:IMPORT_MAX_ERRORS],
+        "parse_seconds": round(parsed - started, 3),
+        "seconds": round(elapsed, 3),
+        "rows_per_s": round(result["rows"] / elapsed, 1) if elapsed else None,
+    }
+
+
+def format_import_report(report: dict) -> str:
+    lines = [
+        "📥 Import yakunlandi.",
+        f"Qatorlar: {report['total']}, saqlandi: {report['rows']}, xato: {report['failed']}",
+        f"Yangi davrlar: {report['periods_created']}",
+        f"Vaqt: {report['seconds']} s ({report['rows_per_s'] or 0:,} qator/s)",
+    ]
+    if report["errors"]:
+        lines.append("")
+        lines += [f"{e['line']}-qator: {e['err']}" for e in report["errors"][:20]]
+        if report["failed"] > 20:
+            lines.append(f"… yana {report['failed'] - 20} ta xato")
+    return "\n".join(lines)
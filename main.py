@@ -1,34 +1,50 @@
+import io
 import os
 import asyncio
 import logging
+import tempfile
 from datetime import date, timedelta, datetime
 from zoneinfo import ZoneInfo
 
 from dotenv import load_dotenv
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 
 from aiogram import Bot, Dispatcher, F
-from aiogram.types import Message, CallbackQuery
-from aiogram.filters import CommandStart
+from aiogram.types import Message, CallbackQuery, FSInputFile
+from aiogram.filters import CommandStart, Command, CommandObject
 from aiogram.fsm.context import FSMContext
 
 from db import (
     db_init,
+    db_close,
+    wal_checkpoint,
+    prune_idempotency_keys,
+    CHECKPOINT_INTERVAL,
     get_or_create_user,
     get_open_period,
     create_period,
-    set_opening_stock,
-    add_sale,
-    add_expense,
-    add_purchase,
-    close_period,
+    record_sale_for_open_period,
+    record_expense_for_open_period,
+    record_purchase_for_open_period,
+    rollover_period,
+    catch_up_overdue,
     period_totals,
     get_reminder,
+    set_reminder,
+    open_periods_for,
 )
 from keyboards import main_menu_kb
-from states import StartState, SaleState, ExpenseState, PurchaseState, CloseState
-from reports import format_period_report
+from states import StartState, SaleState, ExpenseState, PurchaseState, CloseState, ImportState
+from reports import format_period_report, format_history_report
+import history
+import export
+import importer
+from reminders import ReminderScheduler
+from broadcast import Broadcaster
+from fsm_storage import make_storage, SQLiteStorage
+from metrics import BotMetricsMiddleware, start_metrics_server
 
 logging.basicConfig(level=logging.INFO)
 
@@ -41,12 +57,26 @@ def tg_today(dt) -> date:
 load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN", "").strip()
 ALLOWED_ID = os.getenv("ALLOWED_TELEGRAM_ID", "").strip()
+# 1 bo'lsa bir kunda kiritilgan savdolar qo'shilib boradi, aks holda oxirgisi yoziladi
+SALE_ACCUMULATE = os.getenv("SALE_ACCUMULATE", "0").strip() == "1"
 
 if not BOT_TOKEN:
     raise RuntimeError("BOT_TOKEN topilmadi. .env faylni tekshiring!")
 
 bot = Bot(BOT_TOKEN)
-dp = Dispatcher()
+storage = make_storage()
+dp = Dispatcher(storage=storage)
+dp.message.middleware(BotMetricsMiddleware())
+dp.callback_query.middleware(BotMetricsMiddleware())
+
+# AUTO_ROLLOVER=1: muddati AUTO_ROLLOVER_GRACE_DAYS kundan ko'proq o'tgan ochiq davrlar
+# har kecha taxminiy yakuniy ombor bilan yopiladi va yangi davrlar ochiladi
+AUTO_ROLLOVER = os.getenv("AUTO_ROLLOVER", "0").strip() == "1"
+AUTO_ROLLOVER_GRACE_DAYS = int(os.getenv("AUTO_ROLLOVER_GRACE_DAYS", "3"))
+AUTO_ROLLOVER_BATCH = int(os.getenv("AUTO_ROLLOVER_BATCH", "500"))
+
+# polling rejimida /metrics shu portda (webhook rejimida web app o'zi beradi)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
 
 def is_allowed(user_id: int) -> bool:
     if not ALLOWED_ID:
@@ -92,8 +122,7 @@ async def set_opening(m: Message, state: FSMContext):
     today = tg_today(m.date)
     end = today + timedelta(days=14)
 
-    period_id = await create_period(m.from_user.id, today.isoformat(), end.isoformat())
-    await set_opening_stock(period_id, opening)
+    await create_period(m.from_user.id, today.isoformat(), end.isoformat(), opening)
 
     await state.clear()
     await m.answer(
@@ -146,15 +175,12 @@ async def sale_card(m: Message, state: FSMContext):
     data = await state.get_data()
     cash = data["cash"]
 
-    p = await get_open_period(m.from_user.id)
-    if not p:
-        await state.clear()
-        return await m.answer("Ochiq 15 kunlik davr topilmadi. /start bosing.")
-
     d = tg_today(m.date).isoformat()
-    await add_sale(m.from_user.id, p["id"], d, cash, card)
-
+    period_id = await record_sale_for_open_period(m.from_user.id, d, cash, card, accumulate=SALE_ACCUMULATE)
     await state.clear()
+    if period_id is None:
+        return await m.answer("Ochiq 15 kunlik davr topilmadi. /start bosing.")
+
     await m.answer(
         f"✅ Saqlandi.\nNaqd: {cash}\nKarta: {card}\nJami: {cash + card}",
         reply_markup=main_menu_kb(),
@@ -198,15 +224,12 @@ async def expense_note(m: Message, state: FSMContext):
     amount = data["amount"]
     note = m.text.strip()
 
-    p = await get_open_period(m.from_user.id)
-    if not p:
-        await state.clear()
-        return await m.answer("Ochiq 15 kunlik davr topilmadi. /start bosing.")
-
     d = tg_today(m.date).isoformat()
-    await add_expense(m.from_user.id, p["id"], d, amount, note)
-
+    period_id = await record_expense_for_open_period(m.from_user.id, d, amount, note)
     await state.clear()
+    if period_id is None:
+        return await m.answer("Ochiq 15 kunlik davr topilmadi. /start bosing.")
+
     await m.answer("✅ Chiqim saqlandi.", reply_markup=main_menu_kb())
 
 
@@ -247,15 +270,12 @@ async def purchase_note(m: Message, state: FSMContext):
     amount = data["amount"]
     note = m.text.strip()
 
-    p = await get_open_period(m.from_user.id)
-    if not p:
-        await state.clear()
-        return await m.answer("Ochiq 15 kunlik davr topilmadi. /start bosing.")
-
     d = tg_today(m.date).isoformat()
-    await add_purchase(m.from_user.id, p["id"], d, amount, note)
-
+    period_id = await record_purchase_for_open_period(m.from_user.id, d, amount, note)
     await state.clear()
+    if period_id is None:
+        return await m.answer("Ochiq 15 kunlik davr topilmadi. /start bosing.")
+
     await m.answer("✅ Kirim saqlandi.", reply_markup=main_menu_kb())
 
 
@@ -304,108 +324,299 @@ async def close_finish(m: Message, state: FSMContext):
     except:
         return await m.answer("Son kiriting. Masalan: 7200000")
 
-    p = await get_open_period(m.from_user.id)
-    if not p:
+    result = await rollover_period(m.from_user.id, closing)
+    if result is None:
         await state.clear()
         return await m.answer("Ochiq davr topilmadi. /start bosing.")
 
-    await close_period(p["id"], closing)
-    totals = await period_totals(m.from_user.id, p["id"])
-
-    p_closed = {**p, "closing_stock_cost": closing, "is_closed": 1}
-    text = format_period_report(p_closed, totals, closed=True)
-
-    # yangi davr: oldingi end_date + 1 kundan
-    end = datetime.fromisoformat(p["end_date"]).date()
-    new_start = end + timedelta(days=1)
-    new_end = new_start + timedelta(days=14)
-
-    new_period_id = await create_period(m.from_user.id, new_start.isoformat(), new_end.isoformat())
-    await set_opening_stock(new_period_id, closing)
+    snapshot, new_period = result["closed"], result["period"]
+    text = format_period_report(snapshot, snapshot["totals"], closed=True)
 
     await state.clear()
     await m.answer(text, parse_mode="Markdown")
     await m.answer(
-        f"📅 Yangi 15 kunlik davr ochildi: {new_start.isoformat()} → {new_end.isoformat()}",
+        f"📅 Yangi 15 kunlik davr ochildi: {new_period['start_date']} → {new_period['end_date']}",
         reply_markup=main_menu_kb(),
     )
 
 
-# -------------------- REMINDER --------------------
+# --- TARIX ---
+# /tarix — oxirgi davrlar, /tarix 2024-01-01 2024-03-31 — sana oralig'i
+HISTORY_LIMIT = int(os.getenv("HISTORY_LIMIT", "6"))
 
-async def send_daily_reminder():
-    if not ALLOWED_ID:
+@dp.message(Command("tarix"))
+async def history_report(m: Message, command: CommandObject):
+    if not is_allowed(m.from_user.id):
         return
 
-    rid = int(ALLOWED_ID)
+    args = (command.args or "").split()
+    if args:
+        try:
+            start = date.fromisoformat(args[0]).isoformat()
+            end = date.fromisoformat(args[1]).isoformat() if len(args) > 1 else tg_today(m.date).isoformat()
+            report = await history.range_report(m.from_user.id, start, end)
+        except ValueError:
+            return await m.answer("Format: /tarix yoki /tarix 2024-01-01 2024-03-31")
+    else:
+        report = await history.period_report(m.from_user.id, HISTORY_LIMIT)
+        if report is None:
+            return await m.answer("Hali davrlar yo‘q. /start bosing.")
+
+    await m.answer(format_history_report(report), parse_mode="Markdown")
 
-    r = await get_reminder(rid)
-    if r.get("enabled", 1) != 1:
+
+# --- EKSPORT ---
+# /eksport — butun tarix, /eksport 2024-01-01 2024-03-31 — sana oralig'i
+@dp.message(Command("eksport"))
+async def export_ledger(m: Message, command: CommandObject):
+    if not is_allowed(m.from_user.id):
         return
 
-    today = datetime.now(tz=TZ).date()
+    args = (command.args or "").split()
+    try:
+        filters = export.parse_filters(*args[:2])
+    except ValueError:
+        return await m.answer("Format: /eksport yoki /eksport 2024-01-01 2024-03-31")
 
-    p = await get_open_period(rid)
+    # fayl diskka oqim bilan yoziladi, xotirada to'liq saqlanmaydi
+    name = export.export_filename(m.from_user.id, filters)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, name)
+        await export.write_csv(path, m.from_user.id, **filters)
+        await m.answer_document(FSInputFile(path, filename=name), caption="📤 Savdo, kirim va chiqimlar (CSV)")
+
+
+# --- IMPORT ---
+@dp.message(Command("import"))
+async def import_start(m: Message, state: FSMContext):
+    if not is_allowed(m.from_user.id):
+        return
+    await get_or_create_user(m.from_user.id)
+    # o'tgan davrlar ochiq davrdan oldinga joylanadi: avval /start
+    if not await get_open_period(m.from_user.id):
+        return await m.answer("Ochiq davr yo‘q. Avval /start bilan davr oching.")
+    await m.answer(
+        "📥 CSV faylni yuboring (UTF-8). Ustunlar:\n"
+        "type,date,cash,card,amount,note\n"
+        "type: sale / purchase / expense, date: YYYY-MM-DD\n"
+        "Bekor qilish: /start"
+    )
+    await state.set_state(ImportState.file)
+
+
+@dp.message(ImportState.file, F.document)
+async def import_file(m: Message, state: FSMContext):
+    if not is_allowed(m.from_user.id):
+        return
+    if (m.document.file_size or 0) > importer.IMPORT_MAX_BYTES:
+        return await m.answer(f"Fayl juda katta (ko‘pi bilan {importer.IMPORT_MAX_BYTES // (1024 * 1024)} MB).")
+
+    await state.clear()
+    data = await bot.download(m.document)
+    try:
+        text = io.TextIOWrapper(data, encoding="utf-8-sig", newline="")
+        report = await importer.import_csv(m.from_user.id, text, tg_today(m.date).isoformat())
+    except UnicodeDecodeError:
+        return await m.answer("Fayl UTF-8 CSV bo‘lishi kerak.")
+    if report is None:
+        return await m.answer("Ochiq davr yo‘q. /start bosing.", reply_markup=main_menu_kb())
+    await m.answer(importer.format_import_report(report), reply_markup=main_menu_kb())
+
+
+@dp.message(ImportState.file)
+async def import_not_file(m: Message):
+    await m.answer("CSV faylni hujjat sifatida yuboring yoki /start bosing.")
+
+
+# -------------------- REMINDER --------------------
+
+def reminder_message(p, today: date):
     if not p:
-        await bot.send_message(
-            rid,
-            "⏰ Eslatma: botda ochiq 15 kunlik davr yo‘q.\n/start bosing va boshlang‘ich tannarxni kiriting."
+        return (
+            "⏰ Eslatma: botda ochiq 15 kunlik davr yo‘q.\n/start bosing va boshlang‘ich tannarxni kiriting.",
+            {},
         )
-        return
 
     end_date = datetime.fromisoformat(p["end_date"]).date()
 
     if today >= end_date:
-        await bot.send_message(
-            rid,
+        return (
             f"📌 15 kunlik davr tugadi!\n"
             f"📅 Davr: {p['start_date']} → {p['end_date']}\n\n"
             f"✅ Iltimos, *15 kunni yopish* tugmasini bosib,\n"
             f"omborda qolgan tovarning yakuniy tannarxini kiriting.\n"
             f"Shundan keyin foyda/zarar avtomatik hisoblanadi.",
-            parse_mode="Markdown",
+            {"parse_mode": "Markdown"},
         )
-    else:
-        await bot.send_message(
-            rid,
-            "⏰ Eslatma: bugungi savdo/chiqim/kirimni kiritdingizmi?\n"
-            "✅ Menyudan: Savdo kiritish / Chiqim kiritish / Kirim kiritish"
+    return (
+        "⏰ Eslatma: bugungi savdo/chiqim/kirimni kiritdingizmi?\n"
+        "✅ Menyudan: Savdo kiritish / Chiqim kiritish / Kirim kiritish",
+        {},
+    )
+
+
+async def send_daily_reminder(rid: int):
+    today = datetime.now(tz=TZ).date()
+    p = await get_open_period(rid)
+    text, kwargs = reminder_message(p, today)
+    await bot.send_message(rid, text, **kwargs)
+
+
+async def send_reminders(ids: list):
+    # bir slotdagi foydalanuvchilar: davrlar bitta so'rovda, yuborish Broadcaster orqali
+    today = datetime.now(tz=TZ).date()
+    periods = await open_periods_for(ids)
+    messages = ((rid, *reminder_message(periods.get(rid), today)) for rid in ids)
+    stats = await Broadcaster(bot).run(messages)
+    logging.info("eslatmalar: %s", stats)
+    return stats
+
+
+def rollover_message(item: dict):
+    p = item["period"]
+    return (
+        f"⚠️ 15 kunlik davr muddatida yopilmadi, shuning uchun avtomatik yopildi "
+        f"({item['closed']} ta davr).\n"
+        f"Yakuniy ombor *taxminiy*: boshlang‘ich ombor tannarxi ko‘chirildi.\n\n"
+        f"📅 Joriy davr: *{p['start_date']} → {p['end_date']}*",
+        {"parse_mode": "Markdown"},
+    )
+
+
+async def auto_rollover():
+    # muddati o'tgan davrlar partiyalab: har partiya bitta tranzaksiya
+    today = datetime.now(tz=TZ).date()
+    before = (today - timedelta(days=AUTO_ROLLOVER_GRACE_DAYS)).isoformat()
+    after_id, total, periods = 0, 0, 0
+    while True:
+        last_id, done = await catch_up_overdue(
+            today.isoformat(), before=before, after_id=after_id, limit=AUTO_ROLLOVER_BATCH
         )
+        if last_id == after_id:
+            break
+        after_id = last_id
+        total += len(done)
+        periods += sum(item["closed"] for item in done)
+        if done:
+            messages = ((item["telegram_id"], *rollover_message(item)) for item in done)
+            await Broadcaster(bot).run(messages)
+    logging.info("avtomatik yopish: %d ta foydalanuvchi, %d ta davr", total, periods)
+    return total
 
 
 @dp.message(F.text == "/test_reminder")
 async def test_reminder(m: Message):
     if not is_allowed(m.from_user.id):
         return
-    await send_daily_reminder()
+    await send_daily_reminder(m.from_user.id)
     await m.answer("✅ Test eslatma yuborildi.")
 
 
-# -------------------- MAIN --------------------
+# /eslatma 21:30 | /eslatma off | /eslatma on
+@dp.message(Command("eslatma"))
+async def reminder_settings(m: Message, command: CommandObject):
+    if not is_allowed(m.from_user.id):
+        return
 
-async def main():
-    print("BOT: start bo'ldi")
-    await db_init()
-    print("BOT: polling boshlandi")
+    r = await get_reminder(m.from_user.id)
+    arg = (command.args or "").strip().lower()
+    hour, minute, enabled = r["hour"], r["minute"], r["enabled"]
+
+    if arg in ("off", "o'chir"):
+        enabled = 0
+    elif arg in ("on", "yoq"):
+        enabled = 1
+    elif arg:
+        try:
+            hh, mm = arg.split(":")
+            hour, minute = int(hh), int(mm)
+            if not (0 <= hour < 24 and 0 <= minute < 60):
+                raise ValueError
+        except ValueError:
+            return await m.answer("Format: /eslatma 21:30, /eslatma off yoki /eslatma on")
+        enabled = 1
+    else:
+        state = "yoqilgan" if enabled == 1 else "o'chirilgan"
+        return await m.answer(f"⏰ Eslatma: {hour:02d}:{minute:02d} ({state})")
+
+    await set_reminder(m.from_user.id, hour, minute, enabled)
+    state = "yoqildi" if enabled == 1 else "o'chirildi"
+    await m.answer(f"✅ Eslatma {hour:02d}:{minute:02d} ga sozlandi ({state}).")
 
+
+# -------------------- MAIN --------------------
+
+async def start_background():
+    # scheduler (eslatmalar, checkpoint, tozalash): polling va webhook rejimlari uchun umumiy
     scheduler = AsyncIOScheduler(timezone=TZ)
 
-    # 21:00 Toshkent bo'yicha
+    # eslatmalar reminders jadvalidan: har bir (soat, daqiqa) uchun bitta job
     if ALLOWED_ID:
-        rid = int(ALLOWED_ID)
-        r = await get_reminder(rid)
-        if r.get("enabled", 1) == 1:
-            scheduler.add_job(
-                send_daily_reminder,
-                CronTrigger(hour=21, minute=0, timezone=TZ),
-                id="daily_reminder",
-                replace_existing=True,
-            )
+        await get_reminder(int(ALLOWED_ID))  # default 21:00 yozuvi bo'lsin
+    await ReminderScheduler(scheduler, send_reminders, TZ).start()
+
+    # WAL faylni muntazam asosiy bazaga ko'chirish (web app ham shu faylga yozadi)
+    if CHECKPOINT_INTERVAL > 0:
+        scheduler.add_job(
+            wal_checkpoint,
+            IntervalTrigger(seconds=CHECKPOINT_INTERVAL, timezone=TZ),
+            id="wal_checkpoint",
+            replace_existing=True,
+        )
+
+    # /api/batch idempotency kalitlarini tozalash (30 kundan eskilari)
+    scheduler.add_job(
+        prune_idempotency_keys,
+        CronTrigger(hour=4, minute=0, timezone=TZ),
+        id="prune_idempotency_keys",
+        replace_existing=True,
+    )
+
+    if AUTO_ROLLOVER:
+        scheduler.add_job(
+            auto_rollover,
+            CronTrigger(hour=0, minute=30, timezone=TZ),
+            id="auto_rollover",
+            replace_existing=True,
+            coalesce=True,
+            misfire_grace_time=3600,
+        )
+
+    # eskirgan (TTL dan o'tgan) FSM holatlarini tozalash
+    if isinstance(storage, SQLiteStorage):
+        scheduler.add_job(
+            storage.cleanup,
+            IntervalTrigger(hours=1, timezone=TZ),
+            id="fsm_cleanup",
+            replace_existing=True,
+        )
 
     scheduler.start()
+    return scheduler
+
+
+async def main():
+    print("BOT: start bo'ldi")
+    await db_init()
+    scheduler = await start_background()
+    metrics_runner = await start_metrics_server(METRICS_PORT) if METRICS_PORT else None
+    print("BOT: polling boshlandi")
 
-    await dp.start_polling(bot)
+    try:
+        # avval webhook rejimida ishlagan bo'lsa, getUpdates ishlashi uchun
+        await bot.delete_webhook()
+        await dp.start_polling(bot)
+    finally:
+        scheduler.shutdown(wait=False)
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await db_close()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    # BOT_MODE=webhook: bot va Mini App API bitta aiohttp jarayonida (webapp_server.py)
+    if os.getenv("BOT_MODE", "polling").strip().lower() == "webhook":
+        import webapp_server
+        webapp_server.main()
+    else:
+        asyncio.run(main())
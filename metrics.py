@@ -0,0 +1,231 @@
+import os
+import hmac
+import time
+import logging
+import functools
+
+from aiohttp import web
+from aiogram import BaseMiddleware
+
+# Oddiy Prometheus-uslubidagi metrikalar (text exposition format 0.0.4).
+# Har bir jarayon (va har bir worker) o'z metrikalarini /metrics da beradi.
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))  # 0 = slow-query log o'chiq
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "").strip()
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+slow_log = logging.getLogger("slow_query")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in self._values.items():
+            yield self.name, _labels(self.labelnames, key), value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [bucket_counts, sum, count]
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        item = self._values.get(key)
+        if item is None:
+            item = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                item[0][i] += 1
+        item[1] += value
+        item[2] += 1
+
+    def samples(self):
+        names = self.labelnames + ("le",)
+        for key, (counts, total, count) in self._values.items():
+            for bound, c in zip(self.buckets, counts):
+                yield f"{self.name}_bucket", _labels(names, key + (bound,)), c
+            yield f"{self.name}_bucket", _labels(names, key + ("+Inf",)), count
+            yield f"{self.name}_sum", _labels(self.labelnames, key), total
+            yield f"{self.name}_count", _labels(self.labelnames, key), count
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        # barcha sample'larga qo'shiladigan yorliqlar (masalan {"worker": "2"}):
+        # bir nechta worker bo'lsa har birining seriyalari alohida qoladi
+        self.labels = {}
+
+    def _with_const(self, labels: str) -> str:
+        if not self.labels:
+            return labels
+        const = ",".join(f'{n}="{_escape(v)}"' for n, v in self.labels.items())
+        return "{" + const + ("," + labels[1:] if labels else "}")
+
+    def counter(self, name: str, help: str, labelnames=()) -> Counter:
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        # collector() -> [(name, help, {label: value}, value), ...] (gauge sifatida)
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{self._with_const(labels)} {value}")
+        # bir nomdagi sample'lar bitta blokda bo'lishi kerak
+        gauges = {}
+        for collector in self._collectors:
+            for name, help, labels, value in collector():
+                family = gauges.setdefault(name, (help, []))
+                family[1].append(f"{name}{self._with_const(_labels(tuple(labels), tuple(labels.values())))} {value}")
+        for name, (help, samples) in gauges.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_LATENCY = REGISTRY.histogram(
+    "http_request_duration_seconds", "Mini App API so'rovlari davomiyligi", ("method", "route", "status")
+)
+HTTP_ERRORS = REGISTRY.counter("http_request_errors_total", "5xx bilan tugagan so'rovlar", ("method", "route"))
+BOT_LATENCY = REGISTRY.histogram("bot_handler_duration_seconds", "Bot handlerlari davomiyligi", ("handler",))
+BOT_ERRORS = REGISTRY.counter("bot_handler_errors_total", "Xato bilan tugagan bot handlerlari", ("handler",))
+DB_LATENCY = REGISTRY.histogram("db_call_duration_seconds", "db.py funksiyalari davomiyligi", ("function",))
+DB_ERRORS = REGISTRY.counter("db_call_errors_total", "Xato bilan tugagan db.py chaqiruvlari", ("function",))
+
+
+def cache_collector(stats):
+    # stats() -> {kesh nomi: {"hits", "misses", "hit_rate", "size"}}; kesh egasi
+    # modul o'zi ro'yxatdan o'tkazadi, shunda bot va web app ikkalasida ham ko'rinadi
+    def collect():
+        out = []
+        for cache, s in stats().items():
+            labels = {"cache": cache}
+            out.append(("cache_hits", "Kesh hit'lari", labels, s["hits"]))
+            out.append(("cache_misses", "Kesh miss'lari", labels, s["misses"]))
+            out.append(("cache_hit_ratio", "Kesh hit ulushi", labels, round(s["hit_rate"], 4)))
+            out.append(("cache_entries", "Keshdagi yozuvlar soni", labels, s["size"]))
+        return out
+
+    REGISTRY.add_collector(collect)
+    return collect
+
+
+def db_timed(fn):
+    # db.py dagi public async funksiyalar uchun: davomiylik, xatolar va slow-query log
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        except Exception:
+            DB_ERRORS.inc(function=name)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            DB_LATENCY.observe(elapsed, function=name)
+            if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+                slow_log.warning("sekin db chaqiruv: %s %.1f ms", name, elapsed * 1000)
+
+    return wrapper
+
+
+@web.middleware
+async def aiohttp_middleware(request, handler):
+    started = time.perf_counter()
+    resource = request.match_info.route.resource
+    route = resource.canonical if resource is not None else "unmatched"
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        HTTP_LATENCY.observe(time.perf_counter() - started, method=request.method, route=route, status=status)
+        if status >= 500:
+            HTTP_ERRORS.inc(method=request.method, route=route)
+
+
+class BotMetricsMiddleware(BaseMiddleware):
+    # aiogram ichki middleware'i: dp.message.middleware(BotMetricsMiddleware())
+    async def __call__(self, handler, event, data):
+        handler_obj = data.get("handler")
+        name = getattr(getattr(handler_obj, "callback", None), "__name__", type(event).__name__)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            BOT_ERRORS.inc(handler=name)
+            raise
+        finally:
+            BOT_LATENCY.observe(time.perf_counter() - started, handler=name)
+
+
+async def metrics_handler(request):
+    # token faqat sarlavhada: URL dagi ?token= access log va proxy loglariga tushadi
+    if METRICS_TOKEN:
+        auth = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(auth.encode(), f"Bearer {METRICS_TOKEN}".encode()):
+            raise web.HTTPUnauthorized()
+    return web.Response(
+        body=REGISTRY.render().encode(),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+    )
+
+
+async def start_metrics_server(port: int):
+    # polling rejimidagi bot va har bir web worker uchun alohida /metrics
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "0.0.0.0", port).start()
+    return runner
@@ -0,0 +1,87 @@
+import logging
+
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+
+from db import on_reminder_change, reminder_slots, reminder_recipients
+
+log = logging.getLogger(__name__)
+
+JOB_PREFIX = "reminder_"
+
+
+class ReminderScheduler:
+    # Har bir (soat, daqiqa) uchun bitta cron job (ko'pi bilan 1440 ta).
+    # Qabul qiluvchilar job ishga tushganda reminders jadvalidan sahifalab
+    # o'qiladi, shuning uchun foydalanuvchilar soni job soniga ta'sir qilmaydi.
+    def __init__(self, scheduler, send, tz, batch_size: int = 1000, resync_minutes: int = 10):
+        self.scheduler = scheduler
+        self.send = send  # async send(telegram_ids: list)
+        self.tz = tz
+        self.batch_size = batch_size
+        self.resync_minutes = resync_minutes
+
+    @staticmethod
+    def job_id(hour: int, minute: int) -> str:
+        return f"{JOB_PREFIX}{hour:02d}{minute:02d}"
+
+    async def start(self):
+        await self.sync()
+        on_reminder_change(self.on_change)
+        # boshqa jarayon (web app) o'zgartirgan slotlar uchun davriy to'liq sinxronlash
+        self.scheduler.add_job(
+            self.sync,
+            IntervalTrigger(minutes=self.resync_minutes, timezone=self.tz),
+            id="reminder_resync",
+            replace_existing=True,
+        )
+
+    async def sync(self):
+        slots = set(await reminder_slots())
+        wanted = {self.job_id(h, m): (h, m) for h, m in slots}
+        for job in self.scheduler.get_jobs():
+            if job.id.startswith(JOB_PREFIX) and job.id not in wanted:
+                job.remove()
+        for hour, minute in slots:
+            self._ensure_slot(hour, minute)
+
+    async def on_change(self, telegram_id: int, hour: int, minute: int, enabled: int):
+        # yangi slot darhol qo'shiladi; bo'shab qolgan slot keyingi sync'da
+        # yoki birinchi bo'sh ishga tushishda o'chiriladi
+        if enabled == 1:
+            self._ensure_slot(hour, minute)
+
+    def _ensure_slot(self, hour: int, minute: int):
+        job_id = self.job_id(hour, minute)
+        if self.scheduler.get_job(job_id) is not None:
+            return
+        self.scheduler.add_job(
+            self.run_slot,
+            CronTrigger(hour=hour, minute=minute, timezone=self.tz),
+            args=[hour, minute],
+            id=job_id,
+            replace_existing=True,
+            coalesce=True,
+            misfire_grace_time=300,
+        )
+
+    async def run_slot(self, hour: int, minute: int):
+        after_id = 0
+        total = 0
+        while True:
+            ids = await reminder_recipients(hour, minute, after_id, self.batch_size)
+            if not ids:
+                break
+            total += len(ids)
+            try:
+                await self.send(ids)
+            except Exception:
+                log.exception("eslatma yuborishda xato (%02d:%02d)", hour, minute)
+            after_id = ids[-1]
+
+        if total == 0:
+            job = self.scheduler.get_job(self.job_id(hour, minute))
+            if job is not None:
+                job.remove()
+        log.info("eslatma %02d:%02d: %d ta foydalanuvchi", hour, minute, total)
+        return total
@@ -1,17 +1,44 @@
-def format_period_report(period: dict, totals: dict, closed: bool = False) -> str:
-    start = period["start_date"]
-    end = period["end_date"]
+def period_figures(period: dict, totals: dict, closed: bool = False) -> dict:
     opening = int(period.get("opening_stock_cost") or 0)
     closing = period.get("closing_stock_cost", None)
 
     cash = int(totals.get("cash", 0))
     card = int(totals.get("card", 0))
-    sales = cash + card
     purchases = int(totals.get("purchases", 0))
     expenses = int(totals.get("expenses", 0))
 
-    # Agar davr yopilmagan bo'lsa va yakuniy ombor yo'q bo'lsa
+    fig = {
+        "cash": cash,
+        "card": card,
+        "sales": cash + card,
+        "purchases": purchases,
+        "expenses": expenses,
+        "opening": opening,
+        "closing": None,
+        "cogs": None,
+        "gross": None,
+        "net": None,
+    }
+    # Agar davr yopilmagan bo'lsa va yakuniy ombor yo'q bo'lsa foyda hisoblanmaydi
     if (not closed) and (closing is None):
+        return fig
+
+    closing = int(closing or 0)
+    cogs = opening + purchases - closing
+    gross = fig["sales"] - cogs
+    fig.update(closing=closing, cogs=cogs, gross=gross, net=gross - expenses)
+    return fig
+
+
+def format_period_report(period: dict, totals: dict, closed: bool = False) -> str:
+    start = period["start_date"]
+    end = period["end_date"]
+    fig = period_figures(period, totals, closed)
+
+    cash, card, sales = fig["cash"], fig["card"], fig["sales"]
+    purchases, expenses, opening = fig["purchases"], fig["expenses"], fig["opening"]
+
+    if fig["cogs"] is None:
         return (
             f"📊 *Joriy 15 kunlik hisobot*\n"
             f"📅 Davr: *{start} → {end}*\n\n"
@@ -26,10 +53,7 @@ def format_period_report(period: dict, totals: dict, closed: bool = False) -> st
             f"✅ Yakuniy ombor tannarxi kiritilgach foyda avtomatik hisoblanadi."
         )
 
-    closing = int(closing or 0)
-    cogs = opening + purchases - closing
-    gross = sales - cogs
-    net = gross - expenses
+    closing, cogs, gross, net = fig["closing"], fig["cogs"], fig["gross"], fig["net"]
 
     return (
         f"📊 *15 kunlik yakuniy hisobot*\n"
@@ -46,3 +70,41 @@ def format_period_report(period: dict, totals: dict, closed: bool = False) -> st
         f"📈 Gross foyda: *{gross:,} so‘m*\n"
         f"✅ Sof foyda/zarar: *{net:,} so‘m*"
     )
+
+
+def format_history_report(report: dict, max_rows: int = 24) -> str:
+    # history.period_report / history.range_report natijasi uchun
+    lines = [f"🗂 *Tarixiy hisobot*", f"📅 *{report['start']} → {report['end']}*", ""]
+
+    periods = report["periods"]
+    # Telegram xabari 4096 belgidan oshmasin: faqat oxirgi davrlar ro'yxati
+    if len(periods) > max_rows:
+        lines.append(f"… yana {len(periods) - max_rows} ta oldingi davr")
+        periods = periods[-max_rows:]
+    for p in periods:
+        fig = p["figures"]
+        net = f"{fig['net']:,} so‘m" if fig["net"] is not None else "ochiq"
+        if p.get("closing_estimated"):
+            net += " (taxminiy)"
+        lines.append(f"• {p['start_date']} → {p['end_date']}: savdo {fig['sales']:,}, sof: {net}")
+
+    t = report["totals"]
+    lines += [
+        "",
+        f"💰 Savdo: *{t['sales']:,} so‘m*",
+        f"├ Naqd: {t['cash']:,} so‘m",
+        f"└ Karta: {t['card']:,} so‘m",
+        f"📦 Kirim (tannarx): *{t['purchases']:,} so‘m*",
+        f"🧾 Chiqim: *{t['expenses']:,} so‘m*",
+    ]
+    if t["cogs"] is not None:
+        lines += [
+            f"📉 COGS: *{t['cogs']:,} so‘m*",
+            f"📈 Gross foyda: *{t['gross']:,} so‘m*",
+            f"✅ Sof foyda/zarar: *{t['net']:,} so‘m*",
+        ]
+        if not t["complete"]:
+            lines.append("ℹ️ Foyda faqat oraliqqa to‘liq tushgan yopilgan davrlar bo‘yicha.")
+    else:
+        lines.append("ℹ️ Oraliqda yopilgan davr yo‘q: foyda hisoblanmadi.")
+    return "\n".join(lines)
@@ -0,0 +1,296 @@
+import os
+import json
+from dataclasses import dataclass
+from datetime import date
+
+from aiohttp import web
+
+try:
+    import orjson  # ixtiyoriy: pip install orjson
+except ImportError:
+    orjson = None
+
+# /api/* so'rovlari uchun umumiy qatlam: JSON codec, tana hajmi chegarasi,
+# tiplangan so'rov obyektlari va bir xil ko'rinishdagi 400 javoblar.
+JSON_CODEC = os.getenv("JSON_CODEC", "auto").strip().lower()  # auto | orjson | json
+API_MAX_BODY = int(os.getenv("API_MAX_BODY", str(256 * 1024)))  # bayt
+MAX_AMOUNT = 10 ** 15  # so'm; bundan kattasi xato kiritish
+MAX_NOTE = 500
+MAX_INT = 2 ** 63 - 1  # SQLite INTEGER chegarasi: kattasi bazaga yetib 500 bermasin
+
+
+class JsonCodec:
+    def __init__(self, name: str = JSON_CODEC):
+        if name == "orjson" or (name == "auto" and orjson is not None):
+            if orjson is None:
+                raise RuntimeError("JSON_CODEC=orjson, lekin orjson o'rnatilmagan")
+            self.name = "orjson"
+            self.loads = orjson.loads
+            self._dumps = orjson.dumps
+        else:
+            self.name = "json"
+            self.loads = json.loads
+            self._dumps = None
+            self._encoder = json.JSONEncoder(separators=(",", ":"))
+
+    def dumps(self, obj) -> bytes:
+        if self._dumps is not None:
+            return self._dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        return self._encoder.encode(obj).encode()
+
+
+codec = JsonCodec()
+
+def json_response(data, status: int = 200, headers=None) -> web.Response:
+    # web.json_response o'rniga: tanlangan codec bilan, tayyor baytlar
+    return web.Response(body=codec.dumps(data), status=status, headers=headers, content_type="application/json")
+
+
+class ValidationError(ValueError):
+    pass
+
+
+# -------------------- maydonlar --------------------
+
+def amount(body, key: str) -> int:
+    # main.py handlerlari kabi: butun son, manfiy emas ("1 200 000" ham bo'ladi)
+    value = body.get(key, 0)
+    if value is None or value == "":
+        return 0
+    if isinstance(value, bool) or isinstance(value, float) and not value.is_integer():
+        raise ValidationError(f"{key}: butun son kerak")
+    try:
+        n = int(value.replace(" ", "")) if isinstance(value, str) else int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValidationError(f"{key}: butun son kerak")
+    if n < 0:
+        raise ValidationError(f"{key}: manfiy bo'lmasin")
+    if n > MAX_AMOUNT:
+        raise ValidationError(f"{key}: juda katta")
+    return n
+
+def integer(body, key: str, default: int = 0, minimum: int = 0) -> int:
+    value = body.get(key)
+    if value is None or value == "":
+        return default
+    # 1.5 kesilmasin; Infinity/NaN (stdlib json ularni qabul qiladi) ham shu yerda
+    if isinstance(value, bool) or isinstance(value, float) and not value.is_integer():
+        raise ValidationError(f"{key}: butun son kerak")
+    try:
+        n = int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValidationError(f"{key}: butun son kerak")
+    if n < minimum:
+        raise ValidationError(f"{key}: kamida {minimum}")
+    if n > MAX_INT:
+        raise ValidationError(f"{key}: juda katta")
+    return n
+
+def optional_int(body, key: str):
+    return integer(body, key, default=None) if body.get(key) not in (None, "") else None
+
+def boolean(body, key: str, default: bool = False) -> bool:
+    # faqat true/false (yoki 0/1): "false" satri True bo'lib qolmasin
+    value = body.get(key)
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    raise ValidationError(f"{key}: true/false kerak")
+
+def text(body, key: str, default: str = "-", max_len: int = MAX_NOTE) -> str:
+    value = body.get(key)
+    if value is None:
+        return default
+    value = str(value).strip()
+    if len(value) > max_len:
+        raise ValidationError(f"{key}: ko'pi bilan {max_len} belgi")
+    return value or default
+
+def iso_date(body, key: str, default=None):
+    value = body.get(key)
+    if value in (None, ""):
+        return default
+    try:
+        return date.fromisoformat(str(value)).isoformat()
+    except ValueError:
+        raise ValidationError(f"{key}: sana formati YYYY-MM-DD")
+
+def auth(body) -> str:
+    value = body.get("_auth")
+    if not isinstance(value, str) or not value:
+        raise ValidationError("_auth kerak")
+    return value
+
+
+# -------------------- so'rovlar --------------------
+
+@dataclass(frozen=True)
+class AuthRequest:
+    auth: str
+
+    @classmethod
+    def parse(cls, body):
+        return cls(auth=auth(body))
+
+
+@dataclass(frozen=True)
+class SaleRequest:
+    auth: str
+    cash: int
+    card: int
+    accumulate: bool
+
+    @classmethod
+    def parse(cls, body):
+        return cls(
+            auth=auth(body),
+            cash=amount(body, "cash"),
+            card=amount(body, "card"),
+            accumulate=boolean(body, "accumulate"),
+        )
+
+
+@dataclass(frozen=True)
+class EntryRequest:
+    # chiqim va kirim
+    auth: str
+    amount: int
+    note: str
+
+    @classmethod
+    def parse(cls, body):
+        return cls(auth=auth(body), amount=amount(body, "amount"), note=text(body, "note"))
+
+
+@dataclass(frozen=True)
+class HistoryRequest:
+    auth: str
+    start: str
+    end: str
+    limit: int
+
+    @classmethod
+    def parse(cls, body):
+        req = cls(
+            auth=auth(body),
+            start=iso_date(body, "start"),
+            end=iso_date(body, "end"),
+            limit=integer(body, "limit"),
+        )
+        if req.start and req.end and req.start > req.end:
+            raise ValidationError("start > end")
+        return req
+
+
+@dataclass(frozen=True)
+class SyncRequest:
+    auth: str
+    since: int
+    period_id: int
+
+    @classmethod
+    def parse(cls, body):
+        return cls(auth=auth(body), since=optional_int(body, "since"), period_id=optional_int(body, "period_id"))
+
+
+@dataclass(frozen=True)
+class ExportRequest:
+    auth: str
+    start: str
+    end: str
+    period_id: int
+
+    @classmethod
+    def parse(cls, body):
+        req = cls(
+            auth=auth(body),
+            start=iso_date(body, "start"),
+            end=iso_date(body, "end"),
+            period_id=optional_int(body, "period"),
+        )
+        if req.start and req.end and req.start > req.end:
+            raise ValidationError("start > end")
+        return req
+
+    @property
+    def filters(self) -> dict:
+        filters = {"start": self.start, "end": self.end, "period_id": self.period_id}
+        return {k: v for k, v in filters.items() if v is not None}
+
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+BATCH_OPS = ("sale", "expense", "purchase")
+
+def parse_batch_item(raw, today: str) -> dict:
+    # bitta offline navbat elementi; noto'g'ri bo'lsa ValidationError
+    if not isinstance(raw, dict):
+        raise ValidationError("element obyekt bo'lishi kerak")
+    key = str(raw.get("key") or "").strip()
+    if not key or len(key) > 64:
+        raise ValidationError("key noto'g'ri")
+    op = raw.get("op")
+    if op not in BATCH_OPS:
+        raise ValidationError("op noto'g'ri")
+    d = iso_date(raw, "date", today)
+    if d > today:
+        raise ValidationError("sana kelajakda")
+
+    item = {"key": key, "op": op, "date": d}
+    if op == "sale":
+        item.update(
+            cash=amount(raw, "cash"),
+            card=amount(raw, "card"),
+            accumulate=boolean(raw, "accumulate"),
+        )
+    else:
+        item.update(amount=amount(raw, "amount"), note=text(raw, "note"))
+    return item
+
+
+@dataclass(frozen=True)
+class BatchRequest:
+    auth: str
+    items: list  # xom elementlar: har biri parse_batch_item bilan alohida tekshiriladi
+
+    @classmethod
+    def parse(cls, body):
+        items = body.get("items")
+        if not isinstance(items, list) or len(items) > BATCH_MAX_ITEMS:
+            raise ValidationError(f"items ro'yxati kerak (ko'pi bilan {BATCH_MAX_ITEMS} ta)")
+        return cls(auth=auth(body), items=items)
+
+
+# -------------------- aiohttp --------------------
+
+def decode(raw: bytes, schema):
+    try:
+        body = codec.loads(raw)
+    except ValueError:
+        raise ValidationError("JSON noto'g'ri")
+    if not isinstance(body, dict):
+        raise ValidationError("JSON obyekt kerak")
+    return schema.parse(body)
+
+async def read(request: web.Request, schema):
+    # tana hajmi: Content-Length oldindan, qolganini client_max_size tekshiradi
+    if (request.content_length or 0) > API_MAX_BODY:
+        raise web.HTTPRequestEntityTooLarge(API_MAX_BODY, request.content_length)
+    return decode(await request.read(), schema)
+
+
+@web.middleware
+async def api_errors(request, handler):
+    # /api/* xatolari bir xil JSON ko'rinishida: {"ok": false, "err": "..."}
+    try:
+        return await handler(request)
+    except ValidationError as e:
+        return json_response({"ok": False, "err": str(e)}, status=400)
+    except web.HTTPException as e:
+        if not request.path.startswith("/api/") or e.status < 400:
+            raise
+        return json_response({"ok": False, "err": e.reason}, status=e.status, headers={
+            k: v for k, v in e.headers.items() if k.lower() not in ("content-type", "content-length")
+        })
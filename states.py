@@ -17,3 +17,6 @@ class PurchaseState(StatesGroup):
 
 class CloseState(StatesGroup):
     closing_stock = State()
+
+class ImportState(StatesGroup):
+    file = State()
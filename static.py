@@ -0,0 +1,152 @@
+import os
+import gzip
+import hashlib
+import mimetypes
+
+from aiohttp import web
+
+try:
+    import brotli  # ixtiyoriy: pip install brotli
+except ImportError:
+    brotli = None
+
+# Mini App fayllari ishga tushishda bir marta o'qiladi va siqiladi (gzip, bo'lsa
+# brotli). Har bir javob tayyor bayt, kuchli ETag va Cache-Control bilan beriladi,
+# If-None-Match mos kelsa 304. HTML dan boshqa fayllar kontent xeshli nom bilan
+# ham beriladi (app.3f2a9c1e.js): ular "immutable", HTML esa har safar tekshiriladi.
+STATIC_DIR = os.getenv("STATIC_DIR", "./app")
+STATIC_PREFIX = "/static/"
+STATIC_MIN_COMPRESS = 512  # bundan kichik fayllarni siqish foydasiz
+
+COMPRESSIBLE = ("text/", "application/javascript", "application/json", "image/svg+xml")
+HTML_CACHE = "no-cache"
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+PLAIN_CACHE = "public, max-age=300"
+
+
+class Asset:
+    def __init__(self, name: str, body: bytes, content_type: str, cache_control: str):
+        self.name = name
+        self.content_type = content_type
+        self.cache_control = cache_control
+        digest = hashlib.sha256(body).hexdigest()
+        self.hash = digest[:8]
+        self.etag = digest[:32]
+        # encoding -> bayt; identity har doim bor
+        self.variants = {"identity": body}
+        if len(body) >= STATIC_MIN_COMPRESS and content_type.startswith(COMPRESSIBLE):
+            gz = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(gz) < len(body):
+                self.variants["gzip"] = gz
+            if brotli is not None:
+                br = brotli.compress(body, quality=11)
+                if len(br) < len(body):
+                    self.variants["br"] = br
+
+    @property
+    def hashed_name(self) -> str:
+        root, ext = os.path.splitext(self.name)
+        return f"{root}.{self.hash}{ext}"
+
+    def variant_etag(self, encoding: str) -> str:
+        # har bir siqilgan variant alohida bayt ketma-ketligi: ETag ham alohida
+        return f'"{self.etag}"' if encoding == "identity" else f'"{self.etag}-{encoding}"'
+
+
+def _accepted(header: str) -> set:
+    accepted = set()
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def _not_modified(header: str, asset: Asset) -> bool:
+    if not header:
+        return False
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        tag = tag[2:] if tag.startswith("W/") else tag
+        # '"etag"' yoki '"etag-gzip"': asosiy qismi mos kelsa kontent o'zgarmagan
+        if tag.strip('"').split("-")[0] == asset.etag:
+            return True
+    return False
+
+
+class StaticAssets:
+    def __init__(self, root: str = STATIC_DIR):
+        self.root = root
+        self._assets = {}  # so'rov nomi -> Asset (oddiy va xeshli nomlar)
+        self._by_name = {}
+
+    def load(self):
+        files = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in sorted(filenames):
+                path = os.path.join(dirpath, filename)
+                files.append((os.path.relpath(path, self.root).replace(os.sep, "/"), path))
+
+        assets, html = {}, []
+        for name, path in files:
+            with open(path, "rb") as f:
+                body = f.read()
+            content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+            if content_type == "text/html":
+                html.append((name, body))
+                continue
+            assets[name] = Asset(name, body, content_type, PLAIN_CACHE)
+
+        # HTML dagi /static/<nom> havolalari xeshli nomga almashtiriladi
+        for name, body in html:
+            text = body.decode("utf-8")
+            for asset in assets.values():
+                text = text.replace(f"{STATIC_PREFIX}{asset.name}", f"{STATIC_PREFIX}{asset.hashed_name}")
+            assets[name] = Asset(name, text.encode("utf-8"), "text/html; charset=utf-8", HTML_CACHE)
+
+        self._by_name = assets
+        self._assets = dict(assets)
+        for asset in assets.values():
+            if asset.cache_control != HTML_CACHE:
+                self._assets[asset.hashed_name] = asset
+        return self
+
+    def url(self, name: str) -> str:
+        return STATIC_PREFIX + self._by_name[name].hashed_name
+
+    def response(self, request: web.Request, name: str) -> web.Response:
+        asset = self._assets.get(name)
+        if asset is None:
+            raise web.HTTPNotFound()
+        hashed = name != asset.name
+        cache_control = IMMUTABLE_CACHE if hashed else asset.cache_control
+
+        accepted = _accepted(request.headers.get("Accept-Encoding", ""))
+        encoding = next((e for e in ("br", "gzip") if e in accepted and e in asset.variants), "identity")
+        headers = {
+            "ETag": asset.variant_etag(encoding),
+            "Cache-Control": cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        if _not_modified(request.headers.get("If-None-Match", ""), asset):
+            return web.Response(status=304, headers=headers)
+
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        headers["Content-Type"] = asset.content_type
+        return web.Response(body=asset.variants[encoding], headers=headers)
+
+    def stats(self) -> dict:
+        return {
+            name: {enc: len(body) for enc, body in asset.variants.items()}
+            for name, asset in self._by_name.items()
+        }
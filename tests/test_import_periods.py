@@ -0,0 +1,87 @@
+import os
+import asyncio
+import tempfile
+import unittest
+
+import db
+
+
+def period(start, end, pid, closed=1):
+    return [start, end, pid, closed]
+
+
+class AssignPeriodsTest(unittest.TestCase):
+    def test_before_first_period(self):
+        periods = [period("2026-10-01", "2026-10-15", 5, 0)]
+        assign, created = db._assign_periods(periods, ["2026-09-10", "2026-09-20"])
+        # birinchi davrga tutashgan orqaga 15 kunlik zanjir
+        self.assertEqual(created, [period("2026-09-01", "2026-09-15", None), period("2026-09-16", "2026-09-30", None)])
+        self.assertEqual(assign["2026-09-20"][:2], ["2026-09-16", "2026-09-30"])
+        self.assertEqual([p[0] for p in periods], ["2026-09-01", "2026-09-16", "2026-10-01"])
+
+    def test_gap_between_periods(self):
+        periods = [period("2026-09-01", "2026-09-15", 1), period("2026-10-20", "2026-11-03", 2, 0)]
+        assign, created = db._assign_periods(periods, ["2026-10-05", "2026-10-07", "2026-10-18"])
+        # bitta bo'shliq davri ikki sanaga; oxirgisi keyingi davr boshigacha qisqartiriladi
+        self.assertEqual(created, [period("2026-10-01", "2026-10-15", None), period("2026-10-16", "2026-10-19", None)])
+        self.assertIs(assign["2026-10-05"], assign["2026-10-07"])
+
+    def test_existing_periods(self):
+        periods = [period("2026-09-01", "2026-09-15", 1), period("2026-09-16", "2026-09-30", 2, 0)]
+        assign, created = db._assign_periods(periods, ["2026-09-15", "2026-09-16"])
+        self.assertEqual(created, [])
+        self.assertEqual(assign["2026-09-15"][2], 1)
+        self.assertEqual(assign["2026-09-16"][2], 2)
+
+    def test_after_overdue_open_period(self):
+        periods = [period("2026-09-01", "2026-09-15", 1, 0)]
+        assign, created = db._assign_periods(periods, ["2026-10-10"])
+        # muddati o'tgan ochiq davr: yangi davr ochilmaydi
+        self.assertEqual(created, [])
+        self.assertEqual(assign["2026-10-10"][2], 1)
+
+    def test_no_periods(self):
+        periods = []
+        assign, created = db._assign_periods(periods, ["2026-09-20", "2026-10-10"])
+        self.assertEqual(created, [period("2026-09-20", "2026-10-04", None), period("2026-10-05", "2026-10-19", None)])
+        self.assertEqual(assign["2026-10-10"][0], "2026-10-05")
+
+
+class ImportLedgerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        db.DB = os.path.join(self.tmp.name, "test.db")
+
+    def tearDown(self):
+        asyncio.run(db.db_close())
+        self.tmp.cleanup()
+
+    def run_import(self, prepare, rows):
+        async def go():
+            await db.db_init()
+            await prepare()
+            result = await db.import_ledger(1, rows)
+            async with db._conn() as conn:
+                cur = await conn.execute("SELECT start_date, end_date, is_closed FROM periods ORDER BY start_date")
+                periods = await cur.fetchall()
+            await db.db_close()
+            return result, periods
+        return asyncio.run(go())
+
+    def test_refuses_without_open_period(self):
+        async def prepare():
+            pass
+        result, periods = self.run_import(prepare, [("sale", "2026-10-17", 7, 7, 14, None)])
+        self.assertIsNone(result)
+        self.assertEqual(periods, [])
+
+    def test_created_periods_end_before_open_period(self):
+        async def prepare():
+            await db.create_period(1, "2026-10-10", "2026-10-24")
+        result, periods = self.run_import(prepare, [("expense", "2026-10-01", None, None, 5, "-")])
+        self.assertEqual(result["periods_created"], 1)
+        self.assertEqual(periods, [("2026-09-25", "2026-10-09", 1), ("2026-10-10", "2026-10-24", 0)])
+
+
+if __name__ == "__main__":
+    unittest.main()
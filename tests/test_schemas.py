@@ -0,0 +1,101 @@
+import unittest
+
+import schemas
+from schemas import ValidationError
+
+
+class FieldTest(unittest.TestCase):
+    def test_amount(self):
+        self.assertEqual(schemas.amount({"a": "1 200 000"}, "a"), 1200000)
+        self.assertEqual(schemas.amount({"a": 5.0}, "a"), 5)
+        self.assertEqual(schemas.amount({"a": ""}, "a"), 0)
+        self.assertEqual(schemas.amount({}, "a"), 0)
+        for bad in (1.5, -1, "abc", True, float("inf"), float("nan"), schemas.MAX_AMOUNT + 1, [1]):
+            with self.subTest(value=bad), self.assertRaises(ValidationError):
+                schemas.amount({"a": bad}, "a")
+
+    def test_integer(self):
+        self.assertEqual(schemas.integer({"n": "12"}, "n"), 12)
+        self.assertEqual(schemas.integer({"n": 3.0}, "n"), 3)
+        self.assertEqual(schemas.integer({}, "n", default=7), 7)
+        for bad in (1.5, -1, "x", False, float("inf"), float("-inf"), float("nan"), 2 ** 63, {}):
+            with self.subTest(value=bad), self.assertRaises(ValidationError):
+                schemas.integer({"n": bad}, "n")
+
+    def test_optional_int(self):
+        self.assertIsNone(schemas.optional_int({}, "n"))
+        self.assertIsNone(schemas.optional_int({"n": ""}, "n"))
+        self.assertEqual(schemas.optional_int({"n": 0}, "n"), 0)
+        with self.assertRaises(ValidationError):
+            schemas.optional_int({"n": float("inf")}, "n")
+
+    def test_boolean(self):
+        self.assertIs(schemas.boolean({}, "b"), False)
+        self.assertIs(schemas.boolean({"b": 1}, "b"), True)
+        self.assertIs(schemas.boolean({"b": False}, "b"), False)
+        for bad in ("false", "true", "1", 2, 0.0):
+            with self.subTest(value=bad), self.assertRaises(ValidationError):
+                schemas.boolean({"b": bad}, "b")
+
+    def test_text(self):
+        self.assertEqual(schemas.text({"t": "  ijara "}, "t"), "ijara")
+        self.assertEqual(schemas.text({"t": "   "}, "t"), "-")
+        self.assertEqual(schemas.text({}, "t"), "-")
+        with self.assertRaises(ValidationError):
+            schemas.text({"t": "x" * (schemas.MAX_NOTE + 1)}, "t")
+
+    def test_iso_date(self):
+        self.assertEqual(schemas.iso_date({"d": "2026-10-01"}, "d"), "2026-10-01")
+        self.assertIsNone(schemas.iso_date({}, "d"))
+        for bad in ("2026-13-01", "2026-02-30", "01.10.2026"):
+            with self.subTest(value=bad), self.assertRaises(ValidationError):
+                schemas.iso_date({"d": bad}, "d")
+
+    def test_auth(self):
+        self.assertEqual(schemas.auth({"_auth": "x"}), "x")
+        for bad in ({}, {"_auth": ""}, {"_auth": 1}):
+            with self.subTest(body=bad), self.assertRaises(ValidationError):
+                schemas.auth(bad)
+
+
+class DecodeTest(unittest.TestCase):
+    def test_sale(self):
+        req = schemas.decode(b'{"_auth": "x", "cash": "1 000", "card": 5, "accumulate": true}', schemas.SaleRequest)
+        self.assertEqual(req, schemas.SaleRequest(auth="x", cash=1000, card=5, accumulate=True))
+
+    def test_bad_json(self):
+        for raw in (b"{", b"[1, 2]", b'"x"', b"\xff"):
+            with self.subTest(raw=raw), self.assertRaises(ValidationError):
+                schemas.decode(raw, schemas.AuthRequest)
+
+    def test_non_finite_numbers(self):
+        # stdlib json Infinity/NaN ni qabul qiladi: 500 emas, ValidationError bo'lsin
+        for raw in (
+            b'{"_auth": "x", "limit": Infinity}',
+            b'{"_auth": "x", "limit": 1e400}',
+            b'{"_auth": "x", "limit": NaN}',
+            b'{"_auth": "x", "limit": 1.5}',
+        ):
+            with self.subTest(raw=raw), self.assertRaises(ValidationError):
+                schemas.decode(raw, schemas.HistoryRequest)
+        for schema, field in ((schemas.SyncRequest, "since"), (schemas.SyncRequest, "period_id"),
+                              (schemas.ExportRequest, "period")):
+            with self.subTest(field=field), self.assertRaises(ValidationError):
+                schemas.decode(b'{"_auth": "x", "%s": Infinity}' % field.encode(), schema)
+
+    def test_history_range(self):
+        with self.assertRaises(ValidationError):
+            schemas.decode(b'{"_auth": "x", "start": "2026-10-02", "end": "2026-10-01"}', schemas.HistoryRequest)
+
+    def test_batch(self):
+        with self.assertRaises(ValidationError):
+            schemas.decode(b'{"_auth": "x", "items": {}}', schemas.BatchRequest)
+        item = schemas.parse_batch_item({"key": "k", "op": "sale", "cash": 1, "accumulate": 0}, "2026-10-18")
+        self.assertEqual(item["date"], "2026-10-18")
+        self.assertIs(item["accumulate"], False)
+        with self.assertRaises(ValidationError):
+            schemas.parse_batch_item({"key": "k", "op": "sale", "date": "2026-10-19"}, "2026-10-18")
+
+
+if __name__ == "__main__":
+    unittest.main()
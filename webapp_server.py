@@ -1,8 +1,18 @@
+import io
 import os
+import sys
+import time
+import signal
+import socket
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
 from aiohttp import web
+from aiohttp.web_runner import GracefulExit
 from aiogram.utils.web_app import safe_parse_webapp_init_data
 
 from dotenv import load_dotenv
@@ -10,73 +20,538 @@ load_dotenv()
 
 
 import db as db_api
+import history
+import export
+import importer
+from static import StaticAssets, STATIC_PREFIX
+import schemas
+from schemas import json_response, parse_batch_item
+from metrics import REGISTRY, aiohttp_middleware, metrics_handler, cache_collector, start_metrics_server
 
 TZ = ZoneInfo("Asia/Tashkent")
 
+# BOT_MODE=webhook: aiogram dispatcher shu aiohttp ilovaga ulanadi (bitta jarayon,
+# umumiy DB pool va keshlar). Lokal ishlab chiqishda polling (main.py) qoladi.
+BOT_MODE = os.getenv("BOT_MODE", "polling").strip().lower()
+WEBHOOK_BASE = os.getenv("WEBHOOK_BASE", "").strip().rstrip("/")  # https://example.onrender.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/tg/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "").strip()
+
+# WEB_WORKERS>1: supervisor N ta jarayon ochadi, ular bitta portni SO_REUSEPORT
+# bilan bo'lishadi. WORKER_ID ni supervisor har bir worker uchun qo'yadi.
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "1"))
+WORKER_ID = int(os.getenv("WORKER_ID", "0"))
+SHUTDOWN_TIMEOUT = float(os.getenv("WEB_SHUTDOWN_TIMEOUT", "30"))
+# WEB_WORKERS>1 da /metrics asosiy portda tasodifiy workerga tushadi: har bir worker
+# o'z metrikalarini WEB_METRICS_PORT + WORKER_ID portida ham beradi (0 = o'chiq).
+# Bot (polling) o'zining METRICS_PORT idan foydalanadi, portlar to'qnashmasin.
+WEB_METRICS_PORT = int(os.getenv("WEB_METRICS_PORT", "0"))
+WEB_DRAIN_SECONDS = float(os.getenv("WEB_DRAIN_SECONDS", "5"))  # SIGTERM dan keyin /healthz 503 oralig'i
+# shu soniyadan oldin yiqilgan worker "ishga tusha olmadi" hisoblanadi: qayta ochish
+# oralig'i ikki barobar oshadi, ketma-ket WORKER_MAX_FAST_FAILS martadan keyin
+# supervisor to'xtaydi (masalan BOT_TOKEN yo'q bo'lsa cheksiz fork qilinmaydi)
+WORKER_MIN_UPTIME = float(os.getenv("WEB_WORKER_MIN_UPTIME", "10"))
+WORKER_MAX_FAST_FAILS = int(os.getenv("WEB_WORKER_MAX_FAST_FAILS", "5"))
+
+log = logging.getLogger(__name__)
+
 def today_iso() -> str:
     return datetime.now(tz=TZ).date().isoformat()
 
+# Mini App butun sessiya davomida bir xil initData yuboradi: HMAC tekshiruvi
+# natijasi (uid, auth_date) kesh qilinadi. 0 = muddat cheklanmagan.
+AUTH_CACHE_SIZE = int(os.getenv("WEBAPP_AUTH_CACHE_SIZE", "4096"))
+AUTH_MAX_AGE = int(os.getenv("WEBAPP_AUTH_MAX_AGE", "86400"))
+# tanasi JSON bo'lmagan so'rovlar (CSV import) initData ni shu sarlavhada yuboradi
+INIT_DATA_HEADER = "X-Telegram-Init-Data"
+
+
+class AuthCache:
+    def __init__(self, size: int = AUTH_CACHE_SIZE, max_age: int = AUTH_MAX_AGE):
+        self.size = size
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self._items = OrderedDict()  # sha256(init_data) -> (uid, auth_date)
+
+    def is_expired(self, auth_date: int) -> bool:
+        return self.max_age > 0 and time.time() - auth_date > self.max_age
+
+    def get(self, key: bytes):
+        item = self._items.get(key)
+        if item is None:
+            return None
+        if self.is_expired(item[1]):
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return item
+
+    def put(self, key: bytes, uid: int, auth_date: int):
+        if self.size <= 0:
+            return
+        self._items[key] = (uid, auth_date)
+        self._items.move_to_end(key)
+        while len(self._items) > self.size:
+            self._items.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+_auth_cache = AuthCache()
+
+def auth_cache_stats() -> dict:
+    return _auth_cache.stats()
+
+# db va history keshlari o'z modullarida ro'yxatdan o'tgan
+cache_collector(lambda: {"webapp_auth": auth_cache_stats()})
+
 def get_uid(bot_token: str, init_data: str) -> int:
+    key = hashlib.sha256(init_data.encode()).digest()
+    cached = _auth_cache.get(key)
+    if cached is not None:
+        _auth_cache.hits += 1
+        return cached[0]
+    _auth_cache.misses += 1
+
     data = safe_parse_webapp_init_data(token=bot_token, init_data=init_data)
-    return int(data.user.id)
+    auth_date = int(data.auth_date.timestamp())
+    if _auth_cache.is_expired(auth_date):
+        _auth_cache.expired += 1
+        raise ValueError("initData eskirgan")
+    uid = int(data.user.id)
+    _auth_cache.put(key, uid, auth_date)
+    return uid
+
+def mount_bot(app: web.Application):
+    if not WEBHOOK_BASE:
+        raise RuntimeError("WEBHOOK_BASE env topilmadi (masalan: https://example.onrender.com).")
+
+    from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+    import main as bot_app
+
+    SimpleRequestHandler(
+        dispatcher=bot_app.dp,
+        bot=bot_app.bot,
+        secret_token=WEBHOOK_SECRET or None,
+    ).register(app, path=WEBHOOK_PATH)
+
+    scheduler = None
+
+    async def on_startup(app):
+        nonlocal scheduler
+        # bir nechta worker bo'lsa scheduler va set_webhook faqat 0-workerda
+        if WORKER_ID != 0:
+            return
+        scheduler = await bot_app.start_background()
+        await bot_app.bot.set_webhook(
+            WEBHOOK_BASE + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET or None,
+            allowed_updates=bot_app.dp.resolve_used_update_types(),
+        )
+
+    async def on_shutdown(app):
+        # webhook o'chirilmaydi: yangi versiya ishga tushayotgan bo'lishi mumkin
+        if scheduler is not None:
+            scheduler.shutdown(wait=False)
+        await bot_app.bot.session.close()
+
+    app.on_startup.append(on_startup)
+    app.on_shutdown.append(on_shutdown)
 
 async def create_app() -> web.Application:
     bot_token = os.getenv("BOT_TOKEN", "").strip()
     if not bot_token:
         raise RuntimeError("BOT_TOKEN env topilmadi (Render env vars ga qo'ying).")
 
-    app = web.Application()
+    health = {"started": time.time(), "inflight": 0, "requests": 0, "draining": False}
+
+    @web.middleware
+    async def track_inflight(request, handler):
+        health["inflight"] += 1
+        health["requests"] += 1
+        try:
+            return await handler(request)
+        finally:
+            health["inflight"] -= 1
+
+    # /api/* tanalari schemas.API_MAX_BODY dan oshmaydi (import o'z chegarasi bilan oqimda o'qiydi)
+    app = web.Application(
+        middlewares=[aiohttp_middleware, track_inflight, schemas.api_errors],
+        client_max_size=schemas.API_MAX_BODY,
+    )
+
+    # har bir sample worker yorlig'i bilan: scrape qaysi workerga tushsa ham seriyalar aralashmaydi
+    REGISTRY.labels["worker"] = str(WORKER_ID)
+    metrics_runner = None
+
+    async def on_startup(app):
+        nonlocal metrics_runner
+        await db_api.db_init()
+        if WEB_METRICS_PORT:
+            metrics_runner = await start_metrics_server(WEB_METRICS_PORT + WORKER_ID)
+
+    async def on_shutdown(app):
+        # bu yerga kelganda port allaqachon yopilgan; /healthz 503 ni SIGTERM
+        # paytida _drain_on_sigterm qo'yadi (run_worker)
+        health["draining"] = True
+
+    async def on_cleanup(app):
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await db_api.db_close()
+
+    app["health"] = health
+    app.on_startup.append(on_startup)
+    app.on_shutdown.append(on_shutdown)
+    app.on_cleanup.append(on_cleanup)
+
+    async def healthz(request):
+        body = {
+            "ok": not health["draining"],
+            "worker": WORKER_ID,
+            "pid": os.getpid(),
+            "uptime": round(time.time() - health["started"], 1),
+            "inflight": health["inflight"] - 1,  # shu so'rovning o'zi hisobga olinmaydi
+            "requests": health["requests"],
+        }
+        return json_response(body, status=503 if health["draining"] else 200)
+
+    # app/ fayllari bir marta o'qiladi va siqiladi (static.py)
+    assets = StaticAssets().load()
+    app["static"] = assets
 
     async def app_page(request):
-        return web.FileResponse("./app/index.html")
+        return assets.response(request, "index.html")
+
+    async def static_file(request):
+        return assets.response(request, request.match_info["name"])
+
+    def auth_uid(init_data: str) -> int:
+        try:
+            return get_uid(bot_token, init_data)
+        except ValueError:
+            raise web.HTTPUnauthorized(reason="initData noto'g'ri yoki eskirgan")
 
     async def api_sale(request):
-        body = await request.json()
-        uid = get_uid(bot_token, body["_auth"])
-        p = await db_api.get_open_period(uid)
-        if not p:
-            return web.json_response({"ok": False, "err": "Ochiq davr yo‘q. Botda /start qiling."})
-        await db_api.add_sale(uid, p["id"], today_iso(), int(body.get("cash", 0)), int(body.get("card", 0)))
-        return web.json_response({"ok": True})
+        req = await schemas.read(request, schemas.SaleRequest)
+        uid = auth_uid(req.auth)
+        period_id = await db_api.record_sale_for_open_period(
+            uid, today_iso(), req.cash, req.card, accumulate=req.accumulate
+        )
+        if period_id is None:
+            return json_response({"ok": False, "err": "Ochiq davr yo‘q. Botda /start qiling."})
+        return json_response({"ok": True})
 
     async def api_expense(request):
-        body = await request.json()
-        uid = get_uid(bot_token, body["_auth"])
-        p = await db_api.get_open_period(uid)
-        if not p:
-            return web.json_response({"ok": False, "err": "Ochiq davr yo‘q."})
-        await db_api.add_expense(uid, p["id"], today_iso(), int(body.get("amount", 0)), body.get("note", "-"))
-        return web.json_response({"ok": True})
+        req = await schemas.read(request, schemas.EntryRequest)
+        uid = auth_uid(req.auth)
+        period_id = await db_api.record_expense_for_open_period(uid, today_iso(), req.amount, req.note)
+        if period_id is None:
+            return json_response({"ok": False, "err": "Ochiq davr yo‘q."})
+        return json_response({"ok": True})
 
     async def api_purchase(request):
-        body = await request.json()
-        uid = get_uid(bot_token, body["_auth"])
-        p = await db_api.get_open_period(uid)
-        if not p:
-            return web.json_response({"ok": False, "err": "Ochiq davr yo‘q."})
-        await db_api.add_purchase(uid, p["id"], today_iso(), int(body.get("amount", 0)), body.get("note", "-"))
-        return web.json_response({"ok": True})
+        req = await schemas.read(request, schemas.EntryRequest)
+        uid = auth_uid(req.auth)
+        period_id = await db_api.record_purchase_for_open_period(uid, today_iso(), req.amount, req.note)
+        if period_id is None:
+            return json_response({"ok": False, "err": "Ochiq davr yo‘q."})
+        return json_response({"ok": True})
 
     async def api_report(request):
-        body = await request.json()
-        uid = get_uid(bot_token, body["_auth"])
+        req = await schemas.read(request, schemas.AuthRequest)
+        uid = auth_uid(req.auth)
         p = await db_api.get_open_period(uid)
         if not p:
-            return web.json_response({"ok": False, "err": "Ochiq davr yo‘q."})
+            return json_response({"ok": False, "err": "Ochiq davr yo‘q."})
         totals = await db_api.period_totals(uid, p["id"])
-        return web.json_response({"ok": True, "period": p, "totals": totals})
+        return json_response({"ok": True, "period": p, "totals": totals})
+
+    async def api_history(request):
+        # {"start": "2024-01-01", "end": "2024-06-30"} yoki {"limit": 12} (oxirgi davrlar)
+        req = await schemas.read(request, schemas.HistoryRequest)
+        uid = auth_uid(req.auth)
+        if req.start or req.end:
+            start, end = req.start or "0001-01-01", req.end or today_iso()
+            if start > end:
+                raise schemas.ValidationError("start > end")
+            report = await history.range_report(uid, start, end)
+        else:
+            report = await history.period_report(uid, req.limit)
+            if report is None:
+                return json_response({"ok": False, "err": "Davrlar yo‘q."})
+        return json_response({"ok": True, **report})
+
+    async def api_export(request):
+        # POST {"_auth": ..., "start": ..., "end": ..., "period": ...}
+        # yoki GET /api/export?token=... (/api/export/link bergan yuklab olish havolasi).
+        # initData URL da qabul qilinmaydi: u access log va brauzer tarixiga tushadi.
+        if request.method == "GET":
+            link = export.verify_link(bot_token, request.query.get("token", ""))
+            if link is None:
+                raise web.HTTPUnauthorized(reason="Havola noto'g'ri yoki eskirgan")
+            uid, filters = link
+        else:
+            req = await schemas.read(request, schemas.ExportRequest)
+            uid = auth_uid(req.auth)
+            filters = req.filters
+
+        resp = web.StreamResponse(headers={
+            "Content-Type": "text/csv; charset=utf-8",
+            "Content-Disposition": f'attachment; filename="{export.export_filename(uid, filters)}"',
+        })
+        resp.enable_chunked_encoding()
+        await resp.prepare(request)
+        async for data in export.csv_chunks(uid, **filters):
+            await resp.write(data)
+        await resp.write_eof()
+        return resp
+
+    async def api_export_link(request):
+        # {"_auth": ..., filtrlar} -> EXPORT_LINK_TTL soniya amal qiladigan GET havola
+        req = await schemas.read(request, schemas.ExportRequest)
+        uid = auth_uid(req.auth)
+        token = export.sign_link(bot_token, uid, req.filters)
+        return json_response({"ok": True, "url": f"/api/export?token={token}", "expires_in": export.EXPORT_LINK_TTL})
+
+    async def api_import(request):
+        # POST /api/import, X-Telegram-Init-Data: <initData>, tana: CSV (type,date,cash,card,amount,note)
+        init_data = request.headers.get(INIT_DATA_HEADER)
+        if not init_data:
+            raise schemas.ValidationError(f"{INIT_DATA_HEADER} sarlavhasi kerak")
+        uid = auth_uid(init_data)
+        if (request.content_length or 0) > importer.IMPORT_MAX_BYTES:
+            raise web.HTTPRequestEntityTooLarge(importer.IMPORT_MAX_BYTES, request.content_length)
+
+        buf = io.BytesIO()
+        async for data in request.content.iter_chunked(64 * 1024):
+            buf.write(data)
+            if buf.tell() > importer.IMPORT_MAX_BYTES:
+                raise web.HTTPRequestEntityTooLarge(importer.IMPORT_MAX_BYTES, buf.tell())
+        buf.seek(0)
+
+        try:
+            text = io.TextIOWrapper(buf, encoding="utf-8-sig", newline="")
+            report = await importer.import_csv(uid, text, today_iso())
+        except UnicodeDecodeError:
+            raise schemas.ValidationError("Fayl UTF-8 CSV bo'lishi kerak")
+        if report is None:
+            return json_response({"ok": False, "err": "Ochiq davr yo‘q. Botda /start qiling."})
+        return json_response({"ok": True, **report})
+
+    async def api_sync(request):
+        # {"since": <oxirgi seq>, "period_id": <keshdagi davr>}: o'zgarmagan bo'lsa
+        # faqat not_modified, aks holda yig'indilar va since dan keyingi yozuvlar.
+        # If-None-Match: "<period_id>:<seq>" ham qabul qilinadi (304 javob).
+        req = await schemas.read(request, schemas.SyncRequest)
+        uid = auth_uid(req.auth)
+        p = await db_api.get_open_period(uid)
+        if not p:
+            return json_response({"ok": False, "err": "Ochiq davr yo‘q."})
+        since, period_id = req.since, req.period_id
+        if since is None:
+            etag = request.headers.get("If-None-Match", "").strip()
+            etag = etag[2:] if etag.startswith("W/") else etag
+            etag_period, _, etag_seq = etag.strip('"').partition(":")
+            if etag_period.isdigit() and etag_seq.isdigit():
+                since, period_id = int(etag_seq), int(etag_period)
+            else:
+                since = 0
+        if period_id != p["id"]:
+            since = 0  # davr almashgan: mijoz keshini to'liq yangilaydi
+
+        changes = await db_api.sync_changes(uid, p["id"], since)
+        headers = {"ETag": f'"{p["id"]}:{changes["seq"]}"', "Cache-Control": "no-cache"}
+        if not changes["modified"]:
+            if request.headers.get("If-None-Match"):
+                return web.Response(status=304, headers=headers)
+            return json_response({"ok": True, "not_modified": True, "seq": changes["seq"]}, headers=headers)
+        return json_response({
+            "ok": True,
+            "full": since == 0,
+            "seq": changes["seq"],
+            "period": p,
+            "totals": changes["totals"],
+            "entries": changes["entries"],
+        }, headers=headers)
+
+    async def api_batch(request):
+        # offline navbatdagi yozuvlar bitta so'rov va bitta tranzaksiyada
+        req = await schemas.read(request, schemas.BatchRequest)
+        uid = auth_uid(req.auth)
+
+        today = today_iso()
+        results, valid = [], []
+        for raw in req.items:
+            try:
+                item = parse_batch_item(raw, today)
+            except schemas.ValidationError as e:
+                key = raw.get("key") if isinstance(raw, dict) else None
+                results.append({"key": key, "status": "invalid", "err": str(e)})
+                continue
+            valid.append(item)
+            results.append(None)
 
+        period_id, applied = await db_api.apply_batch(uid, valid) if valid else (None, [])
+        applied = iter(applied)
+        results = [r if r is not None else next(applied) for r in results]
+        if valid and period_id is None:
+            return json_response({"ok": False, "err": "Ochiq davr yo‘q.", "items": results})
+        return json_response({"ok": True, "items": results})
+
+    app.router.add_get("/healthz", healthz)
+    app.router.add_get("/metrics", metrics_handler)
     app.router.add_get("/app", app_page)
+    app.router.add_get(STATIC_PREFIX + "{name:.+}", static_file)
     app.router.add_post("/api/sale", api_sale)
     app.router.add_post("/api/expense", api_expense)
     app.router.add_post("/api/purchase", api_purchase)
     app.router.add_post("/api/report", api_report)
+    app.router.add_post("/api/sync", api_sync)
+    app.router.add_post("/api/history", api_history)
+    app.router.add_post("/api/batch", api_batch)
+    app.router.add_get("/api/export", api_export)
+    app.router.add_post("/api/export", api_export)
+    app.router.add_post("/api/export/link", api_export_link)
+    app.router.add_post("/api/import", api_import)
+
+    if BOT_MODE == "webhook":
+        mount_bot(app)
 
     return app
 
+def _graceful_exit():
+    raise GracefulExit()
+
+async def _drain_on_sigterm(app: web.Application):
+    # aiohttp SIGTERM da darhol portni yopadi. Buning o'rniga avval /healthz 503
+    # qaytaradi (balanslovchi yangi so'rov yubormay qo'yadi), WEB_DRAIN_SECONDS
+    # dan keyin odatdagi to'xtash boshlanadi. Ikkinchi SIGTERM darhol to'xtatadi.
+    loop = asyncio.get_running_loop()
+
+    def on_sigterm():
+        if app["health"]["draining"]:
+            _graceful_exit()
+        app["health"]["draining"] = True
+        log.info("SIGTERM: %s s drenaj, keyin to'xtash", WEB_DRAIN_SECONDS)
+        loop.call_later(WEB_DRAIN_SECONDS, _graceful_exit)
+
+    try:
+        loop.add_signal_handler(signal.SIGTERM, on_sigterm)
+    except (NotImplementedError, RuntimeError):
+        pass  # Windows yoki asosiy bo'lmagan thread: aiohttp odatdagidek to'xtaydi
+
+async def _worker_app() -> web.Application:
+    app = await create_app()
+    if WEB_DRAIN_SECONDS > 0:
+        app.on_startup.append(_drain_on_sigterm)
+    return app
+
+def run_worker(port: int, reuse_port: bool = False):
+    web.run_app(
+        _worker_app(),
+        host="0.0.0.0",
+        port=port,
+        reuse_port=reuse_port,
+        shutdown_timeout=SHUTDOWN_TIMEOUT,
+    )
+
+async def _init_db_once():
+    # migratsiyalar workerlar ochilishidan oldin bir marta
+    await db_api.db_init()
+    await db_api.db_close()
+
+def supervise(workers: int, port: int):
+    asyncio.run(_init_db_once())
+
+    children = {}  # pid -> (worker_id, ochilgan vaqt)
+    fast_fails = {}  # worker_id -> ketma-ket tez yiqilishlar
+    stopping = False
+    exit_code = 0
+
+    def spawn(worker_id: int):
+        pid = os.fork()
+        if pid == 0:
+            os.environ["WORKER_ID"] = str(worker_id)
+            global WORKER_ID
+            WORKER_ID = worker_id
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 1
+            try:
+                run_worker(port, reuse_port=True)
+                code = 0
+            except BaseException:
+                log.exception("worker %s yiqildi", worker_id)
+            finally:
+                os._exit(code)
+        children[pid] = (worker_id, time.monotonic())
+        log.info("worker %s ishga tushdi (pid=%s)", worker_id, pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for worker_id in range(workers):
+        spawn(worker_id)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        worker_id, started = children.pop(pid, (None, 0))
+        if worker_id is None or stopping:
+            continue
+        # kutilmagan yiqilish: worker qayta ochiladi, tez yiqilsa kutish oshib boradi
+        if time.monotonic() - started < WORKER_MIN_UPTIME:
+            fast_fails[worker_id] = fast_fails.get(worker_id, 0) + 1
+        else:
+            fast_fails[worker_id] = 0
+        code = os.waitstatus_to_exitcode(status)
+        if fast_fails[worker_id] >= WORKER_MAX_FAST_FAILS:
+            log.error("worker %s ketma-ket %s marta ishga tusha olmadi (exit=%s), supervisor to'xtaydi",
+                      worker_id, fast_fails[worker_id], code)
+            exit_code = 1
+            stop(None, None)
+            continue
+        delay = min(30, 2 ** fast_fails[worker_id])
+        log.warning("worker %s to'xtadi (exit=%s), %s s dan keyin qayta ishga tushiriladi", worker_id, code, delay)
+        time.sleep(delay)
+        # kutish paytida SIGTERM kelgan bo'lsa yangi worker ochilmaydi: stop() uni
+        # ko'rmagan, os.wait() esa abadiy kutib qolardi
+        if stopping:
+            continue
+        spawn(worker_id)
+    return exit_code
+
 def main():
     port = int(os.getenv("PORT", "8080"))
-    web.run_app(create_app(), host="0.0.0.0", port=port)
+    logging.basicConfig(level=logging.INFO)
+    if WEB_WORKERS > 1 and hasattr(os, "fork") and hasattr(socket, "SO_REUSEPORT"):
+        sys.exit(supervise(WEB_WORKERS, port))
+    else:
+        run_worker(port)
 
 if __name__ == "__main__":
     main()